@@ -1,49 +1,103 @@
 from flask import Flask, request, jsonify
 import os
-import shutil
 import zipfile
-import xml.etree.ElementTree as ET
-from pathlib import Path
+from pathlib import PurePosixPath
 import re
-import uuid
-import base64
+import hashlib
 from werkzeug.utils import secure_filename
 import html
+import posixpath
+from bisect import bisect_right
+from concurrent.futures import as_completed
+from time import perf_counter
+
+from engine import NS, Rule, ShardRule, ValidationEngine
+from xml_backend import Path, parse
+from metrics import BYTE_BUCKETS, Counter, Histogram
+from media_store import MediaStore, image_info, sha256_hex
+from style_profiles import get_profile
+from styles import StyleResolver
+from revisions import Revision, context_digest, paragraph_digest
+from safe_zip import ArchiveTooLarge, BoundedZipFile
 
 W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
 R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
 PIC = 'http://schemas.openxmlformats.org/drawingml/2006/picture'
 A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
-UPLOAD_FOLDER = 'uploads'
-EXTRACT_FOLDER = 'extracted'
+DOCUMENT_PART = 'word/document.xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+# Words are whitespace-separated tokens, same as str.split()
+WORD_PATTERN = re.compile(r'\S+')
+# Figure numbers come from media names such as media/image3.png
+FIGURE_NUMBER_PATTERN = re.compile(r'image(\d+)', re.IGNORECASE)
+A_BLIP = f'{{{A}}}blip'
+# Searches the rules make, compiled once (see xml_backend)
+RELATIONSHIP = Path('pr:Relationship', {'pr': PR})
+PAGE_SIZE = Path('w:pgSz', NS)
+PAGE_MARGINS = Path('w:pgMar', NS)
+RUN_TEXT = Path('w:t', NS)
+RUN_PROPERTIES = Path('w:rPr', NS)
+JUSTIFICATION = Path('w:pPr/w:jc', NS)
+# Paragraphs per record when results are streamed
+STREAM_CHUNK_PARAGRAPHS = 50
+
+class InvalidDocument(ValueError):
+    """The upload is a ZIP archive but not a usable DOCX"""
+
 
 # === HELPER FUNCTIONS ===
-def convert_docx_to_zip(docx_path):
-    zip_path = docx_path.with_suffix('.zip')
-    shutil.copy(docx_path, zip_path)
-    return zip_path
-
-def extract_zip_to_unique_folder(zip_path, base_extract_dir=EXTRACT_FOLDER):
-    zip_path = Path(zip_path)
-    folder_name = zip_path.stem + "_unzipped"
-    extract_dir = Path(base_extract_dir) / folder_name
-    extract_dir.mkdir(parents=True, exist_ok=True)
-
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
-    
-    return extract_dir
+def open_docx(stream):
+    """Open an uploaded DOCX (path or file object) as a ZIP archive without extracting it
+
+    Raises safe_zip.ArchiveTooLarge if it would decompress to more than the limits allow.
+    """
+    return BoundedZipFile(stream)
+
+def hash_upload(stream, chunk_size=1 << 20):
+    """SHA-256 hex digest of an upload stream, which is left rewound"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def has_part(docx, part_name):
+    """Check whether the archive contains the given part"""
+    try:
+        docx.getinfo(part_name)
+    except KeyError:
+        return False
+    return True
+
+def read_image_relationships(docx):
+    """Map relationship ids to image targets from document.xml.rels"""
+    image_rels = {}
+    if not has_part(docx, DOCUMENT_RELS_PART):
+        return image_rels
+    try:
+        with docx.open(DOCUMENT_RELS_PART) as rels_file:
+            rels_root = parse(rels_file)
+        for rel in RELATIONSHIP.all(rels_root):
+            rel_id = rel.attrib.get('Id')
+            rel_type = rel.attrib.get('Type')
+            rel_target = rel.attrib.get('Target')
+            if rel_type and 'image' in rel_type:
+                image_rels[rel_id] = rel_target
+    except Exception as e:
+        print(f"Error parsing relationships: {e}")
+    return image_rels
+
+def resolve_part_name(target, base='word'):
+    """Turn a relationship target into the archive member it points at"""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(base, target))
 
 def get_attr(elem, attr, namespace=W):
     return elem.attrib.get(f'{{{namespace}}}{attr}')
 
-def get_text_from_element(element, ns):
-    """Extract text from a paragraph or run element"""
-    text = ""
-    for t in element.findall('.//w:t', ns):
-        text += t.text if t.text else ""
-    return text
-
 def normalize_text(text):
     # Collapse whitespace and remove hidden characters
     return re.sub(r'\s+', '', text.replace('\u00A0', ' ')).strip()
@@ -51,394 +105,1026 @@ def normalize_text(text):
 def is_all_caps(text):
     return text.isupper() and any(c.isalpha() for c in text)
 
-def is_date_like(text):
-    text = normalize_text(text).replace(' ', '')
+def is_date_like(text, profile=None):
+    pattern = (profile or get_profile()).date_pattern
+    return pattern is not None and pattern.search(normalize_text(text).lower()) is not None
 
-    date_patterns = [
-        r'\d{1,2}/\d{1,2}/\d{2,4}',              # 28/05/2025
-        r'\d{4}-\d{1,2}-\d{1,2}',                # 2025-05-28
-        r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\d{1,2},?\d{4}',  # May28,2025
-        r'\d{1,2}(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\d{4}',    # 28May2025
-        r'\d{6}h-\d{6}h(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\d{4}',    # 270800H-280800HMay2025
-        r'\d{4}h-\d{4}h(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\d{4}',    # 2708H-2808HMay2025
-    ]
 
-    for pattern in date_patterns:
-        if re.search(pattern, text.lower()):
-            return True
-    return False
 
+# === VALIDATION RULES ===
+# Bump whenever a rule or the result format changes; cached results are keyed by it
+RULESET_VERSION = '4'
+
+def ruleset_id(profile):
+    """Identifies everything besides the upload that a result depends on"""
+    return f"{RULESET_VERSION}.{profile.name}.{profile.digest}"
+
+class PositionIndex:
+    """Word errors and figure references addressed by (paragraph, offset)
+
+    Offsets are character positions in the paragraph text, so the renderer
+    can look up the markup for each word directly instead of scanning every
+    error and reference in the document.
+    """
+
+    def __init__(self):
+        # paragraph -> ([start offsets], [WordErrors spans]), in document order
+        self.spans = {}
+        # paragraph -> ([start offsets], [references]), kept sorted by start
+        self.references = {}
+
+    def add_span(self, span):
+        starts, spans = self.spans.setdefault(span[0], ([], []))
+        starts.append(span[1])
+        spans.append(span)
+
+    def code_at(self, paragraph, offset):
+        """Return the error code of the span covering ``offset``, if any"""
+        entry = self.spans.get(paragraph)
+        if entry is None:
+            return None
+        starts, spans = entry
+        i = bisect_right(starts, offset) - 1
+        if i >= 0 and offset < spans[i][2]:
+            return spans[i][3]
+        return None
+
+    def add_reference(self, ref):
+        starts, refs = self.references.setdefault(ref["paragraph"], ([], []))
+        i = bisect_right(starts, ref["position"])
+        starts.insert(i, ref["position"])
+        refs.insert(i, ref)
+
+    def release(self, paragraph):
+        """Forget a paragraph once it has been rendered"""
+        self.spans.pop(paragraph, None)
+        self.references.pop(paragraph, None)
+
+    def clear(self):
+        self.spans.clear()
+        self.references.clear()
+
+    def reference_at(self, paragraph, offset):
+        """Return the reference whose text covers ``offset``, if any"""
+        entry = self.references.get(paragraph)
+        if entry is None:
+            return None
+        starts, refs = entry
+        i = bisect_right(starts, offset) - 1
+        if i >= 0 and offset < starts[i] + len(refs[i]["reference"]):
+            return refs[i]
+        return None
+
+
+class WordErrors:
+    """Flagged text as [paragraph, start, end, code] spans over a shared message table
+
+    A code stands for one combination of errors, so a run in the wrong font
+    is one span however many words it holds. Offsets are character
+    positions in the paragraph text; images are zero-length spans.
+    """
+
+    def __init__(self):
+        self.messages = []
+        # code -> indexes into messages
+        self.codes = []
+        # code -> markup class of the words it covers
+        self.classes = []
+        self.spans = []
+        self._message_ids = {}
+        self._code_ids = {}
+
+    def code(self, errors):
+        """The code for a list of {type, message} errors, added to the table if new"""
+        key = tuple((error["type"], error["message"]) for error in errors)
+        code = self._code_ids.get(key)
+        if code is not None:
+            return code
+
+        message_ids = []
+        for error in key:
+            message_id = self._message_ids.get(error)
+            if message_id is None:
+                message_id = self._message_ids[error] = len(self.messages)
+                self.messages.append({"type": error[0], "message": error[1]})
+            message_ids.append(message_id)
+
+        types = {error_type for error_type, _ in key}
+        code = self._code_ids[key] = len(self.codes)
+        self.codes.append(message_ids)
+        self.classes.append("error-word" if "error" in types else "warning-word" if "warning" in types else "doc-word")
+        return code
+
+    def errors(self, code):
+        return [self.messages[i] for i in self.codes[code]]
+
+    def add(self, paragraph, start, end, code):
+        span = [paragraph, start, end, code]
+        self.spans.append(span)
+        return span
 
+    def clear(self):
+        """Drop the spans; codes handed out stay valid"""
+        self.spans = []
+
+    def to_json(self):
+        return {"messages": list(self.messages), "codes": list(self.codes), "spans": self.spans}
+
+
+def columnar_word_errors(word_errors):
+    """The same word errors with the spans as one array per field"""
+    spans = word_errors["spans"]
+    columns = {name: [span[i] for span in spans] for i, name in enumerate(("paragraph", "start", "end", "code"))}
+    return dict(word_errors, spans=columns)
+
+
+class ImageIndex:
+    """Drawings in document.xml, indexed by figure number and media part
+
+    Built in one pass while the document streams past, so figure references
+    resolve with a set lookup and each media part is read at most once.
+    """
+
+    def __init__(self, image_rels):
+        self.image_rels = image_rels
+        self.drawings = []
+        self.figures = set()
+        # media part name -> figure number, in order of first use
+        self.media = {}
+        # Set once the whole body has been indexed
+        self.complete = False
+
+    def add_drawing(self, rel_id, paragraph, position):
+        target = self.image_rels.get(rel_id)
+        if target is None:
+            return None
+
+        match = FIGURE_NUMBER_PATTERN.search(PurePosixPath(target).name)
+        figure = str(int(match.group(1))) if match else None
+        drawing = {
+            "id": f"img_{len(self.drawings) + 1}",
+            "figure": figure,
+            "rel_id": rel_id,
+            "target": target,
+            "part": resolve_part_name(target),
+            "paragraph": paragraph,
+            "position": position,
+        }
+        self.drawings.append(drawing)
+        if figure is not None:
+            self.figures.add(figure)
+        self.media.setdefault(drawing["part"], figure)
+        return drawing
+
+    def has_figure(self, number):
+        return str(int(number)) in self.figures
+
+    @staticmethod
+    def add_word_error(word_errors, drawing):
+        """Keep an image addressable from the viewer as a zero-length span"""
+        code = word_errors.code([{
+            "type": "info",
+            "message": f"Image found: {drawing['target']}"
+        }])
+        word_errors.add(drawing["paragraph"], drawing["position"], drawing["position"], code)
+
+
+class ValidationContext:
+    """Shared state the rules read from and write to while a document streams past"""
+
+    def __init__(self, docx, profile=None):
+        self.docx = docx
+        self.profile = profile or get_profile()
+        self.issues = []
+        self.word_errors = WordErrors()
+        self.image_references = []
+        self.image_index = None
+        # styles.StyleResolver, loaded by the first rule that needs it
+        self.styles = None
+        self.index = PositionIndex()
+        self.content = ""
+        # Words flagged by WordFormattingRule, counted as they are found
+        self.font_error_words = 0
+        self.size_error_words = 0
+        self.unjustified_paragraphs = 0
+        # revisions.Revision whose unchanged paragraphs are reused, if any
+        self.revision = None
+
+
+class ParagraphHashRule(Rule):
+    """Fingerprint each paragraph, reusing earlier results for unchanged ones
+
+    Runs before every other rule, so they can skip a paragraph whose
+    results are taken from the revision being compared against.
+    """
+
+    name = 'paragraph_hash'
+
+    def paragraph(self, ctx, para):
+        para.digest = paragraph_digest(para.element)
+        if ctx.revision is not None:
+            para.reused = ctx.revision.reuse(para.digest)
+
+
+class PageSetupRule(Rule):
+    """Validate page size and margins"""
+
+    name = 'page_setup'
+
+    def start(self, ctx):
+        self.pgSz = None
+        self.pgMar = None
+
+    def section(self, ctx, sect_pr):
+        # The first section that declares a setting is the one checked
+        if self.pgSz is None:
+            self.pgSz = PAGE_SIZE.first(sect_pr)
+        if self.pgMar is None:
+            self.pgMar = PAGE_MARGINS.first(sect_pr)
+
+    def finish(self, ctx):
+        issues = ctx.issues
+        pgSz = self.pgSz
+        if pgSz is None:
+            issues.append({
+                "type": "error",
+                "category": "formatting",
+                "message": "Page size settings not found."
+            })
+            return
+
+        profile = ctx.profile
+        page = profile.page
+        if any(get_attr(pgSz, k) != v for k, v in page.items()):
+            issues.append({
+                "type": "error",
+                "category": "formatting",
+                "message": f"Page size or orientation NOT set to {profile.page_name} (w={page.get('w')}, h={page.get('h')})."
+            })
 
-def validate_page_justify(root, issues):
-    ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-    unjustified_paragraphs = []
+        pgMar = self.pgMar
+
+        if pgMar is None:
+            issues.append({
+                "type": "error",
+                "category": "formatting",
+                "message": "Page margin settings not found."
+            })
+            return
+
+        if any(get_attr(pgMar, k) != v for k, v in profile.margins.items()):
+            issues.append({
+                "type": "error",
+                "category": "formatting",
+                "message": f"Margins NOT set to {profile.margin_name} correctly."
+            })
+
+
+class JustificationRule(Rule):
+    """Flag body paragraphs that are not justified"""
+
+    name = 'justification'
+
+    def paragraph(self, ctx, para):
+        if para.reused is not None:
+            ctx.unjustified_paragraphs += para.reused.unjustified
+            return
 
-    for paragraph in root.findall('.//w:p', ns):
         text_parts = []
-        for run in paragraph.findall('.//w:r', ns):
-            text_elem = run.find('w:t', ns)
+        for run, _ in para.runs:
+            text_elem = RUN_TEXT.first(run)
             if text_elem is not None and text_elem.text:
                 text_parts.append(text_elem.text.strip())
 
         paragraph_text = ' '.join(text_parts).strip()
+        profile = ctx.profile
 
         # Skip empty, all-caps, or date-like paragraphs
-        if not paragraph_text or is_all_caps(paragraph_text) or is_date_like(paragraph_text):
-            continue
+        if not paragraph_text:
+            return
+        if profile.exempt_all_caps and is_all_caps(paragraph_text):
+            return
+        if is_date_like(paragraph_text, profile):
+            return
 
-        pPr = paragraph.find('w:pPr', ns)
         is_heading = False
         justification = 'left'  # default assumption
 
-        if pPr is not None:
-            # Check if paragraph is a heading style
-            pStyle = pPr.find('w:pStyle', ns)
-            if pStyle is not None:
-                style_val = pStyle.attrib.get(f'{{{ns["w"]}}}val', '')
-                if style_val.lower().startswith('heading'):
-                    is_heading = True
-
-            # Get actual justification if defined
-            jc = pPr.find('w:jc', ns)
-            if jc is not None:
-                justification = jc.attrib.get(f'{{{ns["w"]}}}val', 'left')
-
-        if not is_heading and justification != 'both':
-            unjustified_paragraphs.append({
-                'text': paragraph_text,
-                'justification': justification
+        # Check if paragraph is a heading (or other exempt) style
+        if para.style is not None and profile.is_exempt_style(para.style):
+            is_heading = True
+
+        # Get actual justification if defined
+        jc = JUSTIFICATION.first(para.element)
+        if jc is not None:
+            justification = jc.attrib.get(f'{{{W}}}val', 'left')
+
+        if not is_heading and justification != profile.justification:
+            ctx.unjustified_paragraphs += 1
+
+    def finish(self, ctx):
+        if ctx.unjustified_paragraphs:
+            ctx.issues.append({
+                "type": "error",
+                "category": "formatting",
+                "message": "Paragraph not justified."
             })
-    if unjustified_paragraphs:
-         issues.append({
-            "type": "error",
-            "category": "formatting",
-            "message": "Paragraph not justified."
-        })
 
-    return issues
 
+class WordFormattingRule(Rule):
+    """Extract word-level errors for font size and type
 
+    Fonts and sizes are the effective ones, inherited from styles.xml and
+    the theme where the run does not set them itself.
+    """
 
+    name = 'word_formatting'
 
+    def start(self, ctx):
+        if ctx.styles is None:
+            ctx.styles = StyleResolver.from_docx(ctx.docx)
+        # RunProperties -> (font errors, size errors); few distinct ones per document
+        self.checked = {}
 
-def validate_page_size_margins(root, issues):
-    """Validate page size and margins"""
-    ns = {'w': W}
-    pgSz = root.find('.//w:sectPr/w:pgSz', ns)
+    def check(self, profile, props):
+        font_errors = []
+        if any(font not in profile.allowed_fonts for font in (props.ascii, props.hAnsi, props.cs)):
+            font_name = props.ascii or props.hAnsi or props.cs or "Unknown"
+            font_errors.append({
+                "type": "error",
+                "message": f"Font should be {profile.font_names}, found {font_name}"
+            })
 
-    if pgSz is None:
-        issues.append({
-            "type": "error",
-            "category": "formatting",
-            "message": "Page size settings not found."
-        })
-        return issues
-        
-    if get_attr(pgSz, 'w') != '12240' or get_attr(pgSz, 'h') != '15840' or get_attr(pgSz, 'orient') != 'portrait':
-        issues.append({
-            "type": "error",
-            "category": "formatting",
-            "message": "Page size or orientation NOT set to A4 portrait (w=12240, h=15840)."
-        })
+        size_errors = []
+        allowed_sizes = profile.allowed_sizes
+        if props.sz not in allowed_sizes or props.szCs not in allowed_sizes:
+            size = props.sz if props.sz not in allowed_sizes else props.szCs
+            size_errors.append({
+                "type": "warning",
+                "message": f"Font size should be {profile.size_names}, found {size}"
+            })
+        return font_errors, size_errors
 
-    pgMar = root.find('.//w:sectPr/w:pgMar', ns)
-    expected = {'top': '1418', 'right': '1418', 'bottom': '1418', 'left': '1418', 'header': '567', 'footer': '567', 'gutter': '0'}
-    
-    if pgMar is None:
-        issues.append({
-            "type": "error",
-            "category": "formatting",
-            "message": "Page margin settings not found."
-        })
-        return issues
-        
-    if any(get_attr(pgMar, k) != v for k, v in expected.items()):
-        issues.append({
-            "type": "error",
-            "category": "formatting",
-            "message": "Margins NOT set to 2.5cm correctly."
-        })
-    return issues
+    def paragraph(self, ctx, para):
+        word_errors = ctx.word_errors
+        index = ctx.index
+        para_idx = para.index
+        profile = ctx.profile
+        styles = ctx.styles
+        p_style = para.style
+        checked = self.checked
 
-def extract_word_level_errors(root, extract_dir):
-    """Extract word-level errors for font size and type"""
-    ns = {'w': W}
-    word_errors = {}
-    
-    # Get relationship data for image references
-    rels_path = extract_dir / "word" / "_rels" / "document.xml.rels"
-    image_rels = {}
-    if rels_path.exists():
-        try:
-            rels_tree = ET.parse(rels_path)
-            rels_root = rels_tree.getroot()
-            for rel in rels_root.findall('./Relationship', {'': R}):
-                rel_id = rel.attrib.get('Id')
-                rel_type = rel.attrib.get('Type')
-                rel_target = rel.attrib.get('Target')
-                if rel_type and 'image' in rel_type:
-                    image_rels[rel_id] = rel_target
-        except Exception as e:
-            print(f"Error parsing relationships: {e}")
-    
-    # Process paragraphs
-    for para_idx, para in enumerate(root.findall('.//w:p', ns), 1):
-        para_text = get_text_from_element(para, ns)
-        
-        # Process runs within paragraph
-        current_position = 0
-        for run_idx, run in enumerate(para.findall('.//w:r', ns), 1):
-            run_text = get_text_from_element(run, ns)
+        reused = para.reused
+        if reused is not None:
+            new_code = ctx.revision.new_code
+            for start, end, code in reused.word_errors:
+                index.add_span(word_errors.add(para_idx, start, end, new_code(code, word_errors)))
+            ctx.font_error_words += reused.font_words
+            ctx.size_error_words += reused.size_words
+            return
+
+        # Process runs within paragraph, tracking each run's offset in the paragraph text.
+        # Consecutive runs with the same errors share one span.
+        span = None
+        run_end = 0
+        for run, run_text in para.runs:
             if not run_text:
                 continue
-                
-            # Check for properties
-            rPr = run.find('w:rPr', ns)
-            if rPr is not None:
-                # Check font size
-                sz = rPr.find('w:sz', ns)
-                szCs = rPr.find('w:szCs', ns)
-                sz_val = get_attr(sz, 'val') if sz is not None else None
-                szCs_val = get_attr(szCs, 'val') if szCs is not None else None
-                
-                # Check font type
-                rFonts = rPr.find('w:rFonts', ns)
-                font_errors = []
-                
-                if rFonts is not None:
-                    allowed_fonts = ['Times New Roman', None, "None"]
-                    if any(get_attr(rFonts, k) not in allowed_fonts for k in ['ascii', 'hAnsi', 'cs']):
-                        font_name = get_attr(rFonts, 'ascii') or get_attr(rFonts, 'hAnsi') or "Unknown"
-                        font_errors.append({
-                            "type": "error",
-                            "message": f"Font should be Times New Roman, found {font_name}"
-                        })
-                
-                # Check font size
-                size_errors = []
-                if (sz_val not in ['28', '24'] and sz_val is not None) or (szCs_val not in ['28', '24'] and szCs_val is not None):
-                    size_errors.append({
-                        "type": "warning",
-                        "message": f"Font size should be 14pt (28) or 12pt (24), found {sz_val or szCs_val}"
-                    })
-                
-                # If we have errors, add to word_errors
-                if font_errors or size_errors:
-                    for word in run_text.split():
-                        if word.strip():
-                            word_id = f"word_{uuid.uuid4().hex[:8]}"
-                            word_errors[word_id] = {
-                                "word": word,
-                                "paragraph": para_idx,
-                                "position": current_position,
-                                "errors": font_errors + size_errors
-                            }
-                        current_position += len(word) + 1
-                else:
-                    current_position += len(run_text)
-            
-            # Check for images and references
-            drawing = run.find('.//w:drawing', ns)
-            if drawing is not None:
-                try:
-                    # Extract image info
-                    blip = drawing.find('.//a:blip', {'a': A})
-                    if blip is not None:
-                        embed_id = get_attr(blip, 'embed', namespace=R)
-                        if embed_id in image_rels:
-                            image_path = image_rels[embed_id]
-                            # Add image reference info
-                            img_id = f"img_{uuid.uuid4().hex[:8]}"
-                            word_errors[img_id] = {
-                                "word": "[IMAGE]",
-                                "paragraph": para_idx,
-                                "position": current_position,
-                                "is_image": True,
-                                "image_path": image_path,
-                                "errors": [{
-                                    "type": "info",
-                                    "message": f"Image found: {image_path}"
-                                }]
-                            }
-                except Exception as e:
-                    print(f"Error processing image: {e}")
-    
-    return word_errors
+            run_start = run_end
+            run_end += len(run_text)
+            words = len(run_text.split())
+            if not words:
+                continue
+
+            props = styles.run_properties(p_style, RUN_PROPERTIES.first(run))
+            errors = checked.get(props)
+            if errors is None:
+                errors = checked[props] = self.check(profile, props)
+            font_errors, size_errors = errors
+
+            if not (font_errors or size_errors):
+                span = None
+                continue
+
+            code = word_errors.code(font_errors + size_errors)
+            if span is not None and span[3] == code:
+                span[2] = run_start + len(run_text.rstrip())
+            else:
+                start = run_start + len(run_text) - len(run_text.lstrip())
+                span = word_errors.add(para_idx, start, run_start + len(run_text.rstrip()), code)
+                index.add_span(span)
+            if font_errors:
+                ctx.font_error_words += words
+            if size_errors:
+                ctx.size_error_words += words
+
+
+class ImageIndexRule(Rule):
+    """Record every drawing in the body in the document's ImageIndex"""
+
+    name = 'image_index'
+
+    def start(self, ctx):
+        ctx.image_index = ImageIndex(read_image_relationships(ctx.docx))
+
+    def paragraph(self, ctx, para):
+        # Runs of nested paragraphs are already part of their outer paragraph
+        if para.nested:
+            return
+
+        image_index = ctx.image_index
+        run_end = 0
+        for run, run_text in para.runs:
+            run_start = run_end
+            run_end += len(run_text)
+            for blip in run.iter(A_BLIP):
+                drawing = image_index.add_drawing(get_attr(blip, 'embed', namespace=R), para.index, run_start)
+                if drawing is None:
+                    continue
+                # Keep images addressable from the viewer alongside word errors
+                image_index.add_word_error(ctx.word_errors, drawing)
+
+    def finish(self, ctx):
+        ctx.image_index.complete = True
+
 
-def extract_image_references(root, word_errors):
+class ImageReferenceRule(Rule):
     """Extract and validate image references"""
-    ns = {'w': W}
-    image_references = []
-    
+
+    name = 'image_references'
+
     # Regular expression to find figure references
     ref_pattern = re.compile(r'fig(?:ure)?\.?\s*(\d+)', re.IGNORECASE)
-    
-    # Find all paragraphs with potential references
-    for para_idx, para in enumerate(root.findall('.//w:p', ns), 1):
-        para_text = get_text_from_element(para, ns)
-        
+
+    def paragraph(self, ctx, para):
+        image_index = ctx.image_index
         # Find references in text
-        matches = ref_pattern.finditer(para_text)
-        for match in matches:
-            ref_num = match.group(1)
-            ref_id = f"ref_{uuid.uuid4().hex[:8]}"
-            
-            # Check if this reference is valid (image exists)
-            valid = any(
-                error_info.get("is_image", False) and 
-                f"image{ref_num}" in error_info.get("image_path", "").lower()
-                for error_info in word_errors.values()
-            )
-            
-            image_references.append({
-                "id": ref_id,
+        for match in self.ref_pattern.finditer(para.text):
+            ref = {
+                "id": f"ref_{para.index}_{match.start()}",
                 "reference": match.group(0),
-                "number": ref_num,
-                "paragraph": para_idx,
+                "number": match.group(1),
+                "paragraph": para.index,
                 "position": match.start(),
-                "valid": valid
-            })
-    
-    return image_references
+                # Resolved once every image in the document has been seen
+                "valid": image_index.has_figure(match.group(1)) if image_index.complete else None
+            }
+            ctx.image_references.append(ref)
+            ctx.index.add_reference(ref)
 
-def extract_document_content(root, word_errors, image_references):
-    """Extract document content with word-level error markup"""
-    ns = {'w': W}
-    content = []
-    
-    # Process paragraphs
-    for para_idx, para in enumerate(root.findall('.//w:p', ns), 1):
-        para_text = get_text_from_element(para, ns)
-        if not para_text.strip():
-            content.append("<p>&nbsp;</p>")
-            continue
+    def finish(self, ctx):
+        # Check if each reference is valid (image exists)
+        for ref in ctx.image_references:
+            if ref["valid"] is None:
+                ref["valid"] = ctx.image_index.has_figure(ref["number"])
+
+
+class ContentRenderRule(Rule):
+    """Render document content as HTML with word-level error markup"""
+
+    name = 'content'
+
+    def start(self, ctx):
+        # Rendered paragraphs; those holding figure references keep their
+        # parts until reference validity is known at the end of the document
+        self.content = []
+
+    def paragraph(self, ctx, para):
+        self.content.append(self.render(ctx, para))
+        # Later paragraphs never look back, so the index only ever holds this one
+        ctx.index.release(para.index)
+
+    def render(self, ctx, para):
+        """The paragraph's HTML, or its parts if a figure reference is still unresolved"""
+        word_errors = ctx.word_errors
+        index = ctx.index
+        para_idx = para.index
+
+        reused = para.reused
+        if reused is not None and not reused.has_references:
+            return ctx.revision.renumber(reused.html, para_idx, word_errors)
+
+        if not para.text.strip():
+            return "<p>&nbsp;</p>"
         
         # Start paragraph
-        para_content = "<p>"
+        parts = ["<p>"]
+        deferred = False
         
         # Process runs within paragraph
-        current_position = 0
-        for run in para.findall('.//w:r', ns):
-            run_text = get_text_from_element(run, ns)
+        run_end = 0
+        for run, run_text in para.runs:
             if not run_text:
                 continue
+            run_start = run_end
+            run_end += len(run_text)
             
             # Process each word in the run
-            words = run_text.split()
-            for i, word in enumerate(words):
-                # Check if this word has errors
-                error_word_id = None
-                for word_id, error_info in word_errors.items():
-                    if (error_info.get("paragraph") == para_idx and 
-                        error_info.get("word") == word and 
-                        abs(error_info.get("position", 0) - current_position) < 10):
-                        error_word_id = word_id
-                        break
-                
-                # Check if this word is part of an image reference
-                ref_id = None
-                for ref in image_references:
-                    if (ref.get("paragraph") == para_idx and 
-                        current_position >= ref.get("position", 0) and 
-                        current_position < ref.get("position", 0) + len(ref.get("reference", ""))):
-                        ref_id = ref.get("id")
-                        break
+            for i, match in enumerate(WORD_PATTERN.finditer(run_text)):
+                word = match.group()
+                position = run_start + match.start()
+
+                # Add space between words
+                if i:
+                    parts.append(" ")
+
+                # Check if this word has errors, else whether it is part of an image reference
+                code = index.code_at(para_idx, position)
+                ref_info = None if code is not None else index.reference_at(para_idx, position)
                 
                 # Add word with appropriate markup
-                if error_word_id:
-                    error_info = word_errors[error_word_id]
-                    error_types = [err.get("type") for err in error_info.get("errors", [])]
-                    
-                    if "error" in error_types:
-                        class_name = "error-word"
-                    elif "warning" in error_types:
-                        class_name = "warning-word"
-                    else:
-                        class_name = "doc-word"
-                    
-                    para_content += f'<span id="{error_word_id}" class="doc-word {class_name}">{html.escape(word)}</span>'
-                elif ref_id:
-                    ref_info = next((r for r in image_references if r.get("id") == ref_id), None)
-                    if ref_info:
-                        class_name = "valid-ref" if ref_info.get("valid") else "invalid-ref"
-                        para_content += f'<span data-ref-id="{ref_id}" class="img-ref {class_name}">{html.escape(word)}</span>'
-                    else:
-                        para_content += html.escape(word)
-                else:
-                    para_content += html.escape(word)
-                
-                # Add space between words
-                if i < len(words) - 1:
-                    para_content += " "
-                    current_position += len(word) + 1
+                if code is not None:
+                    class_name = word_errors.classes[code]
+                    parts.append(f'<span id="word_{para_idx}_{position}" class="doc-word {class_name}" '
+                                 f'data-code="{code}">{html.escape(word)}</span>')
+                elif ref_info and ref_info["valid"] is None:
+                    parts.append((ref_info, html.escape(word)))
+                    deferred = True
+                elif ref_info:
+                    parts.append(self._ref_span(ref_info, html.escape(word)))
                 else:
-                    current_position += len(word)
+                    parts.append(html.escape(word))
         
         # End paragraph
-        para_content += "</p>"
-        content.append(para_content)
-    
-    return "\n".join(content)
+        parts.append("</p>")
+        return parts if deferred else "".join(parts)
+
+    def finish(self, ctx):
+        ctx.content = "\n".join(
+            para if isinstance(para, str) else "".join(self._render_deferred(para))
+            for para in self.content
+        )
+        self.content = []
+
+    @staticmethod
+    def _ref_span(ref_info, word):
+        class_name = "valid-ref" if ref_info.get("valid") else "invalid-ref"
+        return f'<span data-ref-id="{ref_info["id"]}" class="img-ref {class_name}">{word}</span>'
+
+    @classmethod
+    def _render_deferred(cls, parts):
+        for part in parts:
+            yield part if isinstance(part, str) else cls._ref_span(*part)
+
+
+class StreamingRenderRule(ContentRenderRule):
+    """Render paragraphs for the caller to take() in chunks instead of into ctx.content
+
+    Figure references must already be resolvable, so no paragraph is deferred.
+    """
+
+    def finish(self, ctx):
+        pass
+
+    def take(self):
+        """Hand over the paragraphs rendered since the last call"""
+        content, self.content = self.content, []
+        return content
+
+
+class ProgressRule(Rule):
+    """Report how far the streaming pass has read into document.xml"""
+
+    name = 'progress'
+
+    def __init__(self, report, stream, total_bytes, every=200):
+        self.report = report
+        self.stream = stream
+        self.total_bytes = total_bytes
+        self.every = every
+
+    def paragraph(self, ctx, para):
+        if para.index % self.every or not self.total_bytes:
+            return
+        try:
+            fraction = min(self.stream.tell() / self.total_bytes, 1.0)
+        except (OSError, ValueError):
+            return
+        self.report('parse', fraction)
 
-def extract_images(extract_dir):
-    """Extract images from the document"""
-    images_dir = extract_dir / "word" / "media"
+
+def default_rules():
+    """Fresh instances of the rule set used by /validate, in reporting order"""
+    return [
+        PageSetupRule(),
+        JustificationRule(),
+        WordFormattingRule(),
+        ImageIndexRule(),
+        ImageReferenceRule(),
+        ContentRenderRule(),
+    ]
+
+# === METRICS ===
+STAGE_SECONDS = Histogram('validator_stage_seconds', 'Seconds spent in each stage of a validation',
+                          label='stage', values=('upload', 'open', 'parse', 'parts', 'images', 'serialize', 'total'))
+RULE_SECONDS = Histogram('validator_rule_seconds', 'Seconds each rule spent on one document', label='rule',
+                         values=[rule.name for rule in [ParagraphHashRule()] + default_rules()])
+DOCUMENT_BYTES = Histogram('validator_document_bytes', 'Size of validated uploads', BYTE_BUCKETS)
+DOCUMENT_ITEMS = Counter('validator_document_items_total', 'Paragraphs, runs and images in validated documents',
+                         label='item', values=('paragraphs', 'runs', 'images'))
+
+def source_size(source):
+    """Size in bytes of a path or a seekable file object"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+def extract_images(docx, image_index, media=None):
+    """Describe the images placed in the document body, storing them in ``media`` if given
+
+    Only the hash, type and dimensions go into the response; the bytes are
+    served separately by the media endpoint.
+    """
     images = []
     
-    if images_dir.exists():
-        for img_file in images_dir.glob("*"):
-            if img_file.is_file() and img_file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif']:
-                try:
-                    with open(img_file, 'rb') as f:
-                        img_data = f.read()
-                        img_base64 = base64.b64encode(img_data).decode('utf-8')
-                        
-                    images.append({
-                        "name": img_file.name,
-                        "path": str(img_file.relative_to(extract_dir)),
-                        "data": f"data:image/{img_file.suffix[1:]};base64,{img_base64}"
-                    })
-                except Exception as e:
-                    print(f"Error processing image {img_file}: {e}")
+    for part_name, figure in image_index.media.items():
+        img_path = PurePosixPath(part_name)
+        if img_path.suffix.lower() in IMAGE_EXTENSIONS and has_part(docx, part_name):
+            try:
+                # Members are only decompressed here, one at a time
+                with docx.open(part_name) as f:
+                    img_data = f.read()
+                digest = media.save(img_data) if media is not None else sha256_hex(img_data)
+                content_type, width, height = image_info(img_data)
+                    
+                images.append({
+                    "name": img_path.name,
+                    "path": part_name,
+                    "figure": figure,
+                    "hash": digest,
+                    "content_type": content_type,
+                    "width": width,
+                    "height": height,
+                    "size": len(img_data)
+                })
+            except Exception as e:
+                print(f"Error processing image {part_name}: {e}")
     
     return images
 
-def validate_docx_structure(document_xml_path, extract_dir):
-    """Validate DOCX structure and extract content with error mapping"""
-    tree = ET.parse(document_xml_path)
-    root = tree.getroot()
-    print(root)
-    # Initialize result containers
-    issues = []
-    
-    # Validate page size and margins
-    issues = validate_page_size_margins(root, issues)
-    issues = validate_page_justify(root, issues)
-   
+def validate_docx_file(source, document_id, media_root, progress=None, profile=None, revision=None,
+                       executor=None):
+    """Validate a DOCX (path or file object), storing its images under ``media_root``
 
-    # Extract word-level errors
-    word_errors = extract_word_level_errors(root, extract_dir)
-    
-    # Extract image references
-    image_references = extract_image_references(root, word_errors)
-    
-    # Extract images
-    images = extract_images(extract_dir)
-    
-    # Extract document content with error markup
-    content = extract_document_content(root, word_errors, image_references)
-    
-    # Add summary information
-    font_error_count = sum(1 for info in word_errors.values() 
-                          if any(err.get("type") == "error" and "Font" in err.get("message", "") 
-                                for err in info.get("errors", [])))
-    
-    size_error_count = sum(1 for info in word_errors.values() 
-                          if any(err.get("type") == "warning" and "Font size" in err.get("message", "") 
-                                for err in info.get("errors", [])))
-    
-    invalid_ref_count = sum(1 for ref in image_references if not ref.get("valid"))
+    A plain module-level function so process pools can run it; ``profile``
+    is the name of the style profile to check against. Given an
+    ``executor`` (a process pool) and a path, large documents are split
+    into shards validated in parallel (see plan_shards), and large header,
+    footer and note parts are validated alongside the body (see submit_parts).
+    """
+    if progress:
+        progress('unzip')
+    start = perf_counter()
+    DOCUMENT_BYTES.observe(source_size(source))
+    with open_docx(source) as docx:
+        if not has_part(docx, DOCUMENT_PART):
+            raise InvalidDocument("Invalid DOCX file structure")
+        STAGE_SECONDS.observe(perf_counter() - start, 'open')
+        media = MediaStore(media_root).document(document_id)
+        profile = get_profile(profile)
+        shards = pending_parts = None
+        if executor is not None and isinstance(source, (str, os.PathLike)):
+            pending_parts = submit_parts(executor, source, docx, profile)
+            if revision is None:
+                shards = plan_shards(docx)
+        if shards:
+            results = validate_docx_shards(docx, source, shards, executor, media=media, progress=progress,
+                                           profile=profile, pending_parts=pending_parts)
+        else:
+            results = validate_docx_structure(docx, media=media, progress=progress, profile=profile,
+                                              revision=revision, pending_parts=pending_parts)
+    STAGE_SECONDS.observe(perf_counter() - start, 'total')
+    return results
+
+def validate_docx_structure(docx, media=None, progress=None, profile=None, revision=None, pending_parts=None):
+    """Validate DOCX structure and extract content with error mapping
+
+    Images are written to ``media`` (a media_store.DocumentMedia) when given,
+    and ``profile`` (a style_profiles.StyleProfile) defaults to the house style.
+    ``progress(stage, fraction)`` is called as the stages advance; parsing,
+    the rules and HTML rendering share one streaming pass, reported as 'parse'.
+
+    The result carries ``paragraph_hashes``, the record a later revision is
+    compared against. When ``revision`` (a revisions.Revision of an earlier
+    version) is given, unchanged paragraphs reuse its results and the
+    result gains a ``revision`` entry with the changed-paragraph diff.
+
+    Headers, footers, footnotes and endnotes are checked after the body,
+    except those in ``pending_parts`` (from submit_parts), which are
+    collected from the pool; their results are listed under ``parts``.
+    """
+    ctx = ValidationContext(docx, profile)
+    context = context_digest(docx, ruleset_id(ctx.profile))
+    if revision is not None and revision.context == context:
+        ctx.revision = revision
+
+    # Run every rule over document.xml in a single streaming pass
+    rules = [ParagraphHashRule()] + default_rules()
+    timings = {}
+    start = perf_counter()
+    paragraphs, runs = validation_pass(docx, ctx, rules, timings, progress)
+    # Parsing is what the pass took besides the rules
+    STAGE_SECONDS.observe(perf_counter() - start - sum(timings.values()), 'parse')
+    for name, seconds in timings.items():
+        RULE_SECONDS.observe(seconds, name)
+
+    parts = validate_parts(docx, ctx, pending_parts)
+    results = collect_results(docx, ctx, media, progress, context, paragraphs, runs, parts)
+    if revision is not None:
+        results["revision"] = {
+            "of": revision.document_id,
+            "available": True,
+            "reused": revision.reused,
+            "revalidated": len(paragraphs) - revision.reused,
+            "changes": revision.diff(paragraphs)
+        }
+    return results
+
+def validation_pass(docx, ctx, rules, timings=None, progress=None, first=1, last=None):
+    """Stream document.xml through ``rules``; returns (paragraph records, run count)
+
+    A record, kept for later revisions, holds what one paragraph contributed.
+    Only paragraphs ``first`` to ``last`` (exclusive; None for the rest) are
+    recorded.
+    """
+    paragraphs = []
+    runs = 0
+    with docx.open(DOCUMENT_PART) as document_xml:
+        if progress:
+            progress('parse', 0.0)
+            rules = rules + [ProgressRule(progress, document_xml, docx.getinfo(DOCUMENT_PART).file_size)]
+        counts = (0, 0, 0, 0)
+        for para in ValidationEngine(rules, timings).iterate(document_xml, ctx):
+            if para.index < first or (last is not None and para.index >= last):
+                continue
+            previous, counts = counts, (ctx.unjustified_paragraphs, len(ctx.image_references),
+                                        ctx.font_error_words, ctx.size_error_words)
+            unjustified, references, font_words, size_words = (n - p for n, p in zip(counts, previous))
+            paragraphs.append([para.digest, unjustified, int(references > 0), font_words, size_words])
+            if not para.nested:
+                runs += len(para.runs)
+    return paragraphs, runs
+
+def collect_results(docx, ctx, media, progress, context, paragraphs, runs, parts):
+    """Extract the images and assemble the results of a finished pass"""
+    if progress:
+        progress('images')
+    start = perf_counter()
+    images = extract_images(docx, ctx.image_index, media)
+    STAGE_SECONDS.observe(perf_counter() - start, 'images')
+    DOCUMENT_ITEMS.inc(len(paragraphs), 'paragraphs')
+    DOCUMENT_ITEMS.inc(runs, 'runs')
+    DOCUMENT_ITEMS.inc(len(images), 'images')
+
+    return {
+        "errors": summarize_issues(ctx, parts),
+        "word_errors": ctx.word_errors.to_json(),
+        "image_references": ctx.image_references,
+        "images": images,
+        "content": ctx.content,
+        "parts": parts,
+        "paragraph_hashes": {"context": context, "paragraphs": paragraphs}
+    }
+
+# === SHARDED VALIDATION ===
+# Shards per document, 0 or 1 to validate every document in one process
+VALIDATION_SHARDS = int(os.environ.get('VALIDATION_SHARDS', 0))
+# Smaller document.xml parts are not worth the processes' start-up and parsing
+SHARD_MIN_BYTES = int(os.environ.get('SHARD_MIN_BYTES', 4 << 20))
+PARAGRAPH_TAGS = (b'<w:p>', b'<w:p ', b'<w:p/>')
+DATA_CODE_PATTERN = re.compile(r'data-code="(\d+)"')
+
+def count_paragraphs(docx, chunk_size=1 << 20):
+    """Paragraphs in document.xml, counted from the raw bytes without parsing"""
+    count = 0
+    tail = b''
+    with docx.open(DOCUMENT_PART) as document_xml:
+        while chunk := document_xml.read(chunk_size):
+            data = tail + chunk
+            count += sum(data.count(tag) for tag in PARAGRAPH_TAGS)
+            # Shorter than any tag, so nothing is counted twice
+            tail = data[-4:]
+    return count
+
+def plan_shards(docx, shards=None, min_bytes=None):
+    """[(first, last)] paragraph ranges to validate in parallel, or None for one pass
+
+    The last range is open-ended (``last`` None), so a miscount only
+    unbalances the shards.
+    """
+    shards = VALIDATION_SHARDS if shards is None else shards
+    min_bytes = SHARD_MIN_BYTES if min_bytes is None else min_bytes
+    if shards < 2 or docx.getinfo(DOCUMENT_PART).file_size < min_bytes:
+        return None
+    count = count_paragraphs(docx)
+    if count < shards:
+        return None
+    size = -(-count // shards)
+    bounds = [1 + i * size for i in range(shards)] + [None]
+    return list(zip(bounds, bounds[1:]))
+
+def validate_shard(source, profile_name, first, last):
+    """Run the rules on paragraphs ``first`` to ``last`` of the DOCX at ``source``
+
+    Runs in a worker process. Every shard streams the whole of document.xml:
+    the image index is built from every paragraph, so figure numbers and
+    reference checks match a single pass, while the other rules only see
+    the shard's paragraphs. Page setup is checked by the first shard.
+    """
+    with open_docx(source) as docx:
+        ctx = ValidationContext(docx, get_profile(profile_name))
+        rules = [
+            ShardRule(ParagraphHashRule(), first, last),
+            ShardRule(JustificationRule(), first, last),
+            ShardRule(WordFormattingRule(), first, last),
+            ImageIndexRule(),
+            ShardRule(ImageReferenceRule(), first, last),
+            ShardRule(ContentRenderRule(), first, last),
+        ]
+        if first == 1:
+            rules.insert(1, PageSetupRule())
+        timings = {}
+        start = perf_counter()
+        paragraphs, runs = validation_pass(docx, ctx, rules, timings, first=first, last=last)
+        parse_seconds = perf_counter() - start - sum(timings.values())
+
+    word_errors = ctx.word_errors
+    # The image index also added spans for the other shards' paragraphs
+    word_errors.spans = [span for span in word_errors.spans
+                         if span[0] >= first and (last is None or span[0] < last)]
+    return {
+        "issues": ctx.issues,
+        "word_errors": word_errors.to_json(),
+        "image_references": ctx.image_references,
+        "image_index": ctx.image_index if first == 1 else None,
+        "content": ctx.content,
+        "unjustified_paragraphs": ctx.unjustified_paragraphs,
+        "font_error_words": ctx.font_error_words,
+        "size_error_words": ctx.size_error_words,
+        "paragraphs": paragraphs,
+        "runs": runs,
+        "timings": timings,
+        "parse_seconds": parse_seconds,
+    }
+
+def validate_docx_shards(docx, source, shards, executor, media=None, progress=None, profile=None,
+                         pending_parts=None):
+    """Like validate_docx_structure, with the shards validated on ``executor`` and merged in order
+
+    Word error codes are renumbered into one table in document order, so
+    the results are the same as from a single pass.
+    """
+    ctx = ValidationContext(docx, profile)
+    context = context_digest(docx, ruleset_id(ctx.profile))
+    if progress:
+        progress('parse', 0.0)
+    futures = [executor.submit(validate_shard, os.fspath(source), ctx.profile.name, first, last)
+               for first, last in shards]
+    if progress:
+        for done, _ in enumerate(as_completed(futures), 1):
+            progress('parse', done / len(futures))
+
+    paragraphs = []
+    runs = 0
+    timings = {}
+    parse_seconds = 0.0
+    content = []
+    word_errors = ctx.word_errors
+    for future in futures:
+        shard = future.result()
+        # Document-wide issues (page setup, unjustified paragraphs) are raised once
+        ctx.issues.extend(issue for issue in shard["issues"] if issue not in ctx.issues)
+        if shard["image_index"] is not None:
+            ctx.image_index = shard["image_index"]
+        ctx.image_references.extend(shard["image_references"])
+        ctx.unjustified_paragraphs += shard["unjustified_paragraphs"]
+        ctx.font_error_words += shard["font_error_words"]
+        ctx.size_error_words += shard["size_error_words"]
+
+        # Codes are added to the table as their first span is met, as in a single pass
+        shard_errors = shard["word_errors"]
+        codes = {}
+        for paragraph, start, end, code in shard_errors["spans"]:
+            if code not in codes:
+                codes[code] = word_errors.code([shard_errors["messages"][i] for i in shard_errors["codes"][code]])
+            word_errors.add(paragraph, start, end, codes[code])
+        if shard["paragraphs"]:
+            html_part = shard["content"]
+            if any(old != new for old, new in codes.items()):
+                html_part = DATA_CODE_PATTERN.sub(lambda m: f'data-code="{codes[int(m.group(1))]}"', html_part)
+            content.append(html_part)
+
+        paragraphs.extend(shard["paragraphs"])
+        runs += shard["runs"]
+        for name, seconds in shard["timings"].items():
+            timings[name] = timings.get(name, 0.0) + seconds
+        # Shards parse side by side, so the slowest one is what parsing cost
+        parse_seconds = max(parse_seconds, shard["parse_seconds"])
+    ctx.content = "\n".join(content)
+
+    STAGE_SECONDS.observe(parse_seconds, 'parse')
+    for name, seconds in timings.items():
+        RULE_SECONDS.observe(seconds, name)
+    parts = validate_parts(docx, ctx, pending_parts)
+    return collect_results(docx, ctx, media, progress, context, paragraphs, runs, parts)
+
+# === HEADERS, FOOTERS AND NOTES ===
+TEXT_PART_PATTERN = re.compile(r'word/(header|footer|footnotes|endnotes)(\d*)\.xml')
+TEXT_PART_KINDS = ('header', 'footer', 'footnotes', 'endnotes')
+# Smaller parts are validated in the request's own process; a pool round trip costs more
+PARALLEL_PART_MIN_BYTES = int(os.environ.get('PARALLEL_PART_MIN_BYTES', 64 << 10))
+
+def text_parts(docx):
+    """(part name, kind) of the parts besides document.xml that hold text, in a stable order"""
+    parts = []
+    for name in docx.namelist():
+        match = TEXT_PART_PATTERN.fullmatch(name)
+        if match:
+            kind, number = match.groups()
+            parts.append((TEXT_PART_KINDS.index(kind), int(number or 0), name, kind))
+    return [(name, kind) for _, _, name, kind in sorted(parts)]
+
+def validate_part(docx, part, kind, profile=None, styles=None, render=True):
+    """Check the fonts and sizes of a header, footer or note part, rendering it unless ``render`` is False
+
+    The other rules are about the body: page setup, justification (headers
+    and footers are aligned by design) and figures.
+    """
+    ctx = ValidationContext(docx, profile)
+    ctx.styles = styles
+    rules = [WordFormattingRule()]
+    if render:
+        rules.append(ContentRenderRule())
+    paragraph_count = 0
+    with docx.open(part) as part_xml:
+        for para in ValidationEngine(rules).iterate(part_xml, ctx):
+            paragraph_count = para.index
+            if not render:
+                ctx.word_errors.clear()
+                ctx.index.clear()
+    results = {
+        "part": part,
+        "kind": kind,
+        "paragraphs": paragraph_count,
+        "font_error_words": ctx.font_error_words,
+        "size_error_words": ctx.size_error_words,
+    }
+    if render:
+        results["word_errors"] = ctx.word_errors.to_json()
+        # Word ids are prefixed with the part (header1_word_3_0), so they stay
+        # unique on a page that also shows the body
+        results["content"] = ctx.content.replace('id="word_', f'id="{PurePosixPath(part).stem}_word_')
+    return results
+
+def validate_part_file(source, part, kind, profile_name):
+    """validate_part on the DOCX at ``source``, for process pools"""
+    with open_docx(source) as docx:
+        return validate_part(docx, part, kind, get_profile(profile_name))
+
+def parallel_parts(docx):
+    """(part name, kind) of the text parts large enough to be worth validating on a pool"""
+    return [(part, kind) for part, kind in text_parts(docx)
+            if docx.getinfo(part).file_size >= PARALLEL_PART_MIN_BYTES]
+
+def submit_parts(executor, source, docx, profile):
+    """Start validating the larger text parts on ``executor``; returns {part name: future}"""
+    return {
+        part: executor.submit(validate_part_file, os.fspath(source), part, kind, profile.name)
+        for part, kind in parallel_parts(docx)
+    }
+
+def validate_parts(docx, ctx, pending=None, render=True):
+    """Results of every text part, in order; those in ``pending`` are taken from their futures
+
+    The rest are validated here, with the body's styles.
+    """
+    start = perf_counter()
+    results = []
+    for part, kind in text_parts(docx):
+        future = pending.get(part) if pending else None
+        if future is not None:
+            results.append(future.result())
+            continue
+        if ctx.styles is None:
+            ctx.styles = StyleResolver.from_docx(docx)
+        results.append(validate_part(docx, part, kind, ctx.profile, ctx.styles, render))
+    STAGE_SECONDS.observe(perf_counter() - start, 'parts')
+    return results
+
+def summarize_issues(ctx, parts=()):
+    """Add the document-wide counts to the rules' issues and group them by category
+
+    ``parts`` are the validate_part results of the headers, footers and
+    notes; their counts are reported per part.
+    """
+    issues = ctx.issues
+    font_error_count = ctx.font_error_words
+    size_error_count = ctx.size_error_words
+    invalid_ref_count = sum(1 for ref in ctx.image_references if not ref.get("valid"))
+    image_count = len(ctx.image_index.media)
     
     # Add summary issues
     if font_error_count > 0:
@@ -455,6 +1141,23 @@ def validate_docx_structure(document_xml_path, extract_dir):
             "message": f"Found {size_error_count} words with incorrect font size."
         })
     
+    for part in parts:
+        name = PurePosixPath(part["part"]).name
+        if part["font_error_words"] > 0:
+            issues.append({
+                "type": "error",
+                "category": "fonts",
+                "part": part["part"],
+                "message": f"Found {part['font_error_words']} words with incorrect font type in {name}."
+            })
+        if part["size_error_words"] > 0:
+            issues.append({
+                "type": "warning",
+                "category": "fonts",
+                "part": part["part"],
+                "message": f"Found {part['size_error_words']} words with incorrect font size in {name}."
+            })
+
     if invalid_ref_count > 0:
         issues.append({
             "type": "warning",
@@ -462,25 +1165,99 @@ def validate_docx_structure(document_xml_path, extract_dir):
             "message": f"Found {invalid_ref_count} invalid image references."
         })
     
-    if len(images) > 0:
+    if image_count > 0:
         issues.append({
             "type": "info",
             "category": "images",
-            "message": f"Found {len(images)} images in the document."
+            "message": f"Found {image_count} images in the document."
         })
     
     # Categorize issues
-    categorized_errors = {
+    return {
         "summary": issues,
         "formatting": [issue for issue in issues if issue.get("category") == "formatting"],
         "fonts": [issue for issue in issues if issue.get("category") == "fonts"],
         "images": [issue for issue in issues if issue.get("category") == "images"]
     }
-    
-    return {
-        "errors": categorized_errors,
-        "word_errors": word_errors,
-        "image_references": image_references,
-        "images": images,
-        "content": content
+
+def check_docx_structure(docx, profile=None):
+    """Run the checks without rendering anything; returns (ctx, paragraph count)
+
+    Word errors are dropped as soon as they are counted, so memory stays
+    flat; the context keeps the issues, the counters, the figure references
+    and the image index.
+    """
+    ctx = ValidationContext(docx, profile)
+    engine = ValidationEngine([
+        PageSetupRule(),
+        JustificationRule(),
+        WordFormattingRule(),
+        ImageIndexRule(),
+        ImageReferenceRule(),
+    ])
+    paragraph_count = 0
+    with docx.open(DOCUMENT_PART) as document_xml:
+        for para in engine.iterate(document_xml, ctx):
+            paragraph_count = para.index
+            ctx.word_errors.clear()
+            ctx.index.clear()
+    return ctx, paragraph_count
+
+def stream_docx_structure(docx, media=None, chunk_size=STREAM_CHUNK_PARAGRAPHS, profile=None):
+    """Validate a DOCX as a series of records, keeping at most one chunk in memory
+
+    The first record is the summary (``type`` "summary", with the images,
+    the header, footer and note parts and the paragraph count). It needs the whole document, so document.xml is
+    streamed twice: once for the checks, keeping only counts and the image
+    index, then again to render ``chunk_size`` paragraphs at a time with
+    their word errors and figure references ("paragraphs" records).
+    """
+    ctx, paragraph_count = check_docx_structure(docx, profile)
+    parts = validate_parts(docx, ctx)
+
+    image_index = ctx.image_index
+    styles = ctx.styles
+    yield {
+        "type": "summary",
+        "errors": summarize_issues(ctx, parts),
+        "images": extract_images(docx, image_index, media),
+        "parts": parts,
+        "paragraphs": paragraph_count
     }
+
+    drawings = {}
+    for drawing in image_index.drawings:
+        drawings.setdefault(drawing["paragraph"], []).append(drawing)
+
+    # The index is complete now, so references resolve as they are found
+    # and every paragraph renders straight away
+    ctx = ValidationContext(docx, profile)
+    ctx.image_index = image_index
+    ctx.styles = styles
+    renderer = StreamingRenderRule()
+    engine = ValidationEngine([WordFormattingRule(), ImageReferenceRule(), renderer])
+
+    def chunk(first, last):
+        record = {
+            "type": "paragraphs",
+            "first": first,
+            "last": last,
+            "content": renderer.take(),
+            "word_errors": ctx.word_errors.to_json(),
+            "image_references": ctx.image_references
+        }
+        ctx.word_errors.clear()
+        ctx.image_references = []
+        ctx.index.clear()
+        return record
+
+    first = 1
+    with docx.open(DOCUMENT_PART) as document_xml:
+        for para in engine.iterate(document_xml, ctx):
+            for drawing in drawings.pop(para.index, ()):
+                image_index.add_word_error(ctx.word_errors, drawing)
+            if para.index - first + 1 >= chunk_size:
+                yield chunk(first, para.index)
+                first = para.index + 1
+    if first <= paragraph_count:
+        yield chunk(first, paragraph_count)
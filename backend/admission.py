@@ -0,0 +1,138 @@
+"""Admission control for synchronous validations.
+
+At most ``limit`` validations run at once across every worker process;
+further requests wait in a queue of at most ``queue_limit`` for up to
+``queue_timeout`` seconds, and anything beyond that is turned away at once
+so the client can retry instead of the server running out of memory. The
+counters live in shared memory created before the workers fork (gunicorn's
+``preload_app``), so the limits and metrics hold for the whole server.
+
+Slots and queue places are also counted per worker pid, so those of a
+worker that dies without giving them back (killed for running out of
+memory, say) are reclaimed by the master's ``child_exit`` hook.
+"""
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+
+MAX_INFLIGHT_VALIDATIONS = int(os.environ.get('MAX_INFLIGHT_VALIDATIONS', os.cpu_count() or 1))
+VALIDATION_QUEUE_LIMIT = int(os.environ.get('VALIDATION_QUEUE_LIMIT', 2 * MAX_INFLIGHT_VALIDATIONS))
+VALIDATION_QUEUE_TIMEOUT = float(os.environ.get('VALIDATION_QUEUE_TIMEOUT', 30))
+
+COUNTERS = ('in_flight', 'queued', 'admitted', 'rejected_queue_full', 'rejected_timeout')
+# Worker processes tracked at once, each in a row of (pid, slots held, requests queued)
+PROCESS_ROWS = 256
+OWNER_FIELDS = ('pid', 'in_flight', 'queued')
+
+
+class Saturated(Exception):
+    """No validation slot is free and the wait queue is full, or the wait timed out"""
+
+
+class Admission:
+    """A cross-process counting semaphore with a bounded wait queue"""
+
+    def __init__(self, limit=MAX_INFLIGHT_VALIDATIONS, queue_limit=VALIDATION_QUEUE_LIMIT,
+                 queue_timeout=VALIDATION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self._slots = multiprocessing.BoundedSemaphore(limit)
+        self._lock = multiprocessing.Lock()
+        self._counters = multiprocessing.Array('q', len(COUNTERS), lock=False)
+        self._wait_seconds = multiprocessing.Value('d', 0.0, lock=False)
+        self._owners = multiprocessing.Array('q', PROCESS_ROWS * len(OWNER_FIELDS), lock=False)
+
+    def _row(self, pid, create=True):
+        """Offset of ``pid``'s row in the owner table, or None; call with the lock held"""
+        owners = self._owners
+        free = None
+        for row in range(0, len(owners), len(OWNER_FIELDS)):
+            if owners[row] == pid:
+                return row
+            if free is None and owners[row] == 0:
+                free = row
+        if create and free is not None:
+            owners[free] = pid
+            return free
+        # A full table only means a dead worker's share cannot be reclaimed
+        return None
+
+    def _add(self, name, n=1):
+        self._counters[COUNTERS.index(name)] += n
+        if name in OWNER_FIELDS:
+            row = self._row(os.getpid())
+            if row is not None:
+                self._owners[row + OWNER_FIELDS.index(name)] += n
+
+    def acquire(self, bounded=True):
+        """Take a slot, waiting in the queue if need be; raises Saturated
+
+        Background jobs pass ``bounded=False``: they have a queue of their
+        own, so they wait for as long as it takes instead of being refused.
+        """
+        if self._slots.acquire(block=False):
+            with self._lock:
+                self._add('in_flight')
+                self._add('admitted')
+            return
+
+        with self._lock:
+            if bounded and self._counters[COUNTERS.index('queued')] >= self.queue_limit:
+                self._add('rejected_queue_full')
+                raise Saturated()
+            self._add('queued')
+        start = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.queue_timeout if bounded else None)
+        with self._lock:
+            self._add('queued', -1)
+            self._wait_seconds.value += time.monotonic() - start
+            if not acquired:
+                self._add('rejected_timeout')
+                raise Saturated()
+            self._add('in_flight')
+            self._add('admitted')
+
+    def release(self):
+        with self._lock:
+            self._add('in_flight', -1)
+        self._slots.release()
+
+    def reclaim(self, pid):
+        """Give back the slots and queue places held by ``pid``, a worker that has exited
+
+        Returns the number of slots reclaimed. Runs in the gunicorn master,
+        so it gives up rather than hang if a dead worker left the lock held.
+        """
+        if not self._lock.acquire(timeout=5):
+            return 0
+        try:
+            row = self._row(pid, create=False)
+            if row is None:
+                return 0
+            slots, queued = self._owners[row + 1:row + len(OWNER_FIELDS)]
+            for i in range(len(OWNER_FIELDS)):
+                self._owners[row + i] = 0
+            self._counters[COUNTERS.index('in_flight')] -= slots
+            self._counters[COUNTERS.index('queued')] -= queued
+        finally:
+            self._lock.release()
+        for _ in range(slots):
+            self._slots.release()
+        return slots
+
+    @contextmanager
+    def slot(self, bounded=True):
+        self.acquire(bounded)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(zip(COUNTERS, self._counters))
+            wait_seconds = self._wait_seconds.value
+        return dict(counters, queue_wait_seconds=round(wait_seconds, 3), limit=self.limit,
+                    queue_limit=self.queue_limit, queue_timeout=self.queue_timeout)
@@ -1,12 +1,119 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, url_for, abort, Response, stream_with_context
 
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import json
+import time
+from urllib.parse import urljoin
+from time import perf_counter
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 from Validation import *
+from admission import Admission, Saturated
+from batch import get_pool, reset_pool, spool_batch
+from jobs import JobQueueFull, JobStore, JOBS_FOLDER
+import metrics
+from media_store import DocumentMedia, MediaStore, MEDIA_FOLDER, HEX_DIGEST
+from paged_content import CONTENT_PAGE_LIMIT, PagedContent
+from response_encoding import negotiated_response
+from result_cache import ResultCache, CACHE_FOLDER
+from storage import Janitor, Workspaces, WORKSPACE_FOLDER
+from style_profiles import PROFILES, UnknownProfile, get_profile
 app = Flask(__name__)
 CORS(app)
-UPLOAD_FOLDER = 'uploads'
-EXTRACT_FOLDER = 'extracted'
+# Behind a reverse proxy, the X-Forwarded-* headers of this many proxies give the public scheme and host
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 0))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS, x_host=PROXY_HOPS)
+# Larger request bodies are refused with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 256 << 20))
+media_store = MediaStore(MEDIA_FOLDER)
+# Media URLs are content hashes, so responses never go stale
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+RESULT_CACHE_MEMORY_BYTES = int(os.environ.get('RESULT_CACHE_MEMORY_BYTES', 64 << 20))
+RESULT_CACHE_DISK_BYTES = int(os.environ.get('RESULT_CACHE_DISK_BYTES', 1 << 30))
+result_cache = ResultCache(CACHE_FOLDER, RESULT_CACHE_MEMORY_BYTES, RESULT_CACHE_DISK_BYTES)
+
+job_store = JobStore(JOBS_FOLDER)
+workspaces = Workspaces(WORKSPACE_FOLDER)
+# Started once the serving process exists: in each gunicorn worker after
+# the fork (see gunicorn.conf.py), or below for the development server
+janitor = Janitor(media_store, result_cache, job_store, workspaces)
+# Created before gunicorn forks its workers, so the limits hold across all of them
+admission = Admission()
+# Seconds a client is asked to wait when the job queue or the disk is full, and between SSE polls
+JOB_RETRY_AFTER = 5
+JOB_EVENTS_INTERVAL = 0.5
+# Longest an SSE stream stays open; EventSource clients reconnect and pick up where they were
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get('JOB_EVENTS_MAX_SECONDS', 300))
+NDJSON = 'application/x-ndjson'
+
+
+def finish_results(results, document_id, profile):
+    """Add the response-only fields to a validation result"""
+    results["document_id"] = document_id
+    results["profile"] = profile.name
+    for image in results["images"]:
+        image["url"] = url_for('document_media', document_id=document_id, digest=image["hash"])
+        image["thumbnail_url"] = url_for('document_media_thumbnail', document_id=document_id, digest=image["hash"])
+    
+    # Add validation complete message
+    if "summary" in results["errors"]:
+        results["errors"]["summary"].append({
+            "type": "success",
+            "category": "general",
+            "message": "Validation complete."
+        })
+    return results
+
+def external_url(path):
+    """An absolute URL for a path on this server
+
+    The frontend runs on another origin, so links it is handed must name the API's host.
+    """
+    return urljoin(request.host_url, path)
+
+def shape_results(results):
+    """Results as the client asked for them
+
+    Image links are made absolute here rather than in finish_results, so
+    cached results do not depend on the host they were first served from.
+    ?word_errors=columns gives the spans one array per field, and
+    ?content=pages leaves the content to GET /documents/<id>/content.
+    """
+    if results.get("images"):
+        results = dict(results, images=[
+            dict(image, url=external_url(image["url"]), thumbnail_url=external_url(image["thumbnail_url"]))
+            if "url" in image else image
+            for image in results["images"]
+        ])
+    if request.args.get('content') == 'pages' and "content" in results and "document_id" in results:
+        results = paged_results(results)
+    if request.args.get('word_errors') == 'columns' and "spans" in results.get("word_errors", ()):
+        return dict(results, word_errors=columnar_word_errors(results["word_errors"]))
+    return results
+
+def paged_results(results):
+    """Results without the content and word error spans, which are served a page at a time
+
+    The rendered paragraphs are stored for paging the first time a
+    document's results are asked for this way.
+    """
+    document_id = results["document_id"]
+    profile = get_profile(results["profile"])
+    pages = PagedContent(media_store.document(document_id).folder, ruleset_id(profile))
+    count = pages.count()
+    if count is None:
+        pages.write(results["content"])
+        count = pages.count()
+    shaped = {key: value for key, value in results.items() if key != "content"}
+    shaped["word_errors"] = {key: value for key, value in results["word_errors"].items() if key != "spans"}
+    shaped["paragraph_count"] = count
+    shaped["content_url"] = url_for('document_content', document_id=document_id, profile=profile.name, _external=True)
+    return shaped
 
 
 @app.route('/validate', methods=['POST'])
@@ -20,40 +127,472 @@ def validate_docx():
     if not filename.endswith('.docx'):
         return jsonify({"error": "Only .docx files are allowed"}), 400
 
-    # Save file
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    uploaded_file.save(filepath)
-
-    # Process the file
+    # Process the file straight from the upload stream; nothing is written to disk unless it is sharded
     try:
-        zip_path = convert_docx_to_zip(Path(filepath))
-        extract_dir = extract_zip_to_unique_folder(zip_path)
-        xml_path = extract_dir / "word" / "document.xml"
-        
-        if not xml_path.exists():
-            return jsonify({"error": "Invalid DOCX file structure"}), 400
-            
-        results = validate_docx_structure(xml_path, extract_dir)
-        
-        # Add validation complete message
-        if "summary" in results["errors"]:
-            results["errors"]["summary"].append({
-                "type": "success",
-                "category": "general",
-                "message": "Validation complete."
-            })
+        profile = requested_profile()
+        # Identical uploads validated under the same ruleset and profile are served from cache
+        start = perf_counter()
+        document_id = hash_upload(uploaded_file.stream)
+        STAGE_SECONDS.observe(perf_counter() - start, 'upload')
+        if wants_stream():
+            if not janitor.has_room():
+                return storage_full()
+            admission.acquire()
+            try:
+                response = stream_validation(uploaded_file, document_id, profile)
+            except BaseException:
+                admission.release()
+                raise
+            response.call_on_close(admission.release)
+            return response
+        cache_key = ResultCache.key(document_id, ruleset_id(profile))
+        results = cached_results(cache_key, document_id)
+        if results is None:
+            if not janitor.has_room():
+                return storage_full()
+            revision_of = request.values.get('revision_of')
+            revision = load_revision(revision_of, profile) if revision_of else None
+            if request.args.get('async') in ('1', 'true'):
+                return start_validation_job(uploaded_file, filename, document_id, profile, revision)
+            with admission.slot():
+                results = validate_upload(uploaded_file, document_id, profile, revision)
+            results = finish_results(results, document_id, profile)
+            cache_results(document_id, profile, results)
+            if revision_of and revision is None:
+                results["revision"] = {"of": revision_of, "available": False}
             
-        return jsonify(results), 200
+        start = perf_counter()
+        response = negotiated_response(shape_results(results))
+        STAGE_SECONDS.observe(perf_counter() - start, 'serialize')
+        return response
+    except Saturated:
+        return saturated()
+    except ArchiveTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+    except (zipfile.BadZipFile, InvalidDocument) as e:
+        return jsonify({"error": error_message(e)}), 400
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+def validate_upload(uploaded_file, document_id, profile, revision=None):
+    """Validate an upload straight from its stream, or with the worker pool's help
+
+    Shards and large header, footer and note parts are validated in other
+    processes, which reopen the document, so for those the upload is first
+    saved to a workspace.
+    """
+    if not uses_pool(uploaded_file.stream, revision):
+        return validate_docx_file(uploaded_file.stream, document_id, media_store.root,
+                                  profile=profile.name, revision=revision)
+    folder = workspaces.create('upload')
+    try:
+        path = str(folder / 'document.docx')
+        uploaded_file.save(path)
+        return validate_sharded(path, document_id, profile=profile.name, revision=revision)
+    finally:
+        workspaces.remove(folder)
+
+def uses_pool(stream, revision=None):
+    """Whether an upload may be split into shards or has text parts to validate on the pool
+
+    Only the archive's directory is read; the stream is left rewound.
+    """
+    if VALIDATION_SHARDS >= 2 and revision is None:
+        return True
+    try:
+        with open_docx(stream) as docx:
+            return bool(parallel_parts(docx))
+    finally:
+        stream.seek(0)
+
+def validate_sharded(path, document_id, **kwargs):
+    """validate_docx_file on a saved DOCX, with shards and large text parts on the worker pool"""
+    pool = get_pool()
+    try:
+        return validate_docx_file(path, document_id, media_store.root, executor=pool, **kwargs)
+    except BrokenProcessPool:
+        reset_pool(pool)
+        raise
+
+def cached_results(cache_key, document_id):
+    """A cached result whose media is still on disk, or None"""
+    results = result_cache.get(cache_key)
+    if results is None:
+        return None
+    media = media_store.document(document_id)
+    if any(media.path(image["hash"]) is None for image in results["images"]):
+        result_cache.discard(cache_key)
+        return None
+    media.touch()
+    return results
+
+def saturated():
+    response = jsonify({"error": "Too many validations in progress, please retry later"})
+    response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+    return response, 429
+
+def storage_full():
+    response = jsonify({"error": "Server storage is full, please retry later"})
+    response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+    return response, 507
+
+def cache_results(document_id, profile, results):
+    """Cache a finished result, with its paragraph record stored alongside for later revisions
+
+    The record and any revision diff are taken out of ``results`` first;
+    the diff is put back for the response but never cached.
+    """
+    ruleset = ruleset_id(profile)
+    record = results.pop("paragraph_hashes", None)
+    revision = results.pop("revision", None)
+    result_cache.put(ResultCache.key(document_id, ruleset), results)
+    if record is not None:
+        result_cache.put(ResultCache.key(document_id, ruleset, 'paragraphs'), record)
+    if revision is not None:
+        results["revision"] = revision
+
+def load_revision(document_id, profile):
+    """Results of an earlier upload to validate a revision against, or None if not cached"""
+    if not HEX_DIGEST.fullmatch(document_id):
+        return None
+    ruleset = ruleset_id(profile)
+    record = result_cache.get(ResultCache.key(document_id, ruleset, 'paragraphs'))
+    result = result_cache.get(ResultCache.key(document_id, ruleset)) if record is not None else None
+    if result is None:
+        return None
+    return Revision(document_id, record, result)
+
+def requested_profile():
+    """The style profile named by the 'profile' query or form field; raises UnknownProfile"""
+    return get_profile(request.values.get('profile'))
+
+def wants_stream():
+    """Streaming is opt-in, with ?stream=1 or by accepting only NDJSON"""
+    return request.args.get('stream') in ('1', 'true') or request.accept_mimetypes.best == NDJSON
+
+def stream_validation(uploaded_file, document_id, profile):
+    """Validate an upload as NDJSON: the summary first, then paragraph chunks
+
+    Nothing is cached, so memory stays bounded by the chunk size.
+    """
+    docx = open_docx(uploaded_file.stream)
+    if not has_part(docx, DOCUMENT_PART):
+        docx.close()
+        raise InvalidDocument("Invalid DOCX file structure")
+
+    def generate():
+        try:
+            records = stream_docx_structure(docx, media=media_store.document(document_id), profile=profile)
+            for record in records:
+                if record["type"] == "summary":
+                    record = finish_results(record, document_id, profile)
+                yield json.dumps(shape_results(record)) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+        except Exception as e:
+            # Headers are already sent, so failures are reported in the stream
+            import traceback
+            print(traceback.format_exc())
+            yield json.dumps({"type": "error", "error": error_message(e)}) + "\n"
+        finally:
+            docx.close()
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+def run_validation_job(progress, path, document_id, profile, revision=None):
+    try:
+        with admission.slot(bounded=False):
+            return validate_sharded(path, document_id, progress=progress, profile=profile, revision=revision)
+    except zipfile.BadZipFile as e:
+        raise InvalidDocument(error_message(e)) from e
+    finally:
+        os.remove(path)
+
+def start_validation_job(uploaded_file, filename, document_id, profile, revision=None):
+    """Queue an upload for background validation and return 202 with the job id"""
+    try:
+        job_id = job_store.create(document_id=document_id, filename=filename, profile=profile.name)
+    except JobQueueFull:
+        return saturated()
+
+    path = job_store.upload_path(job_id)
+    try:
+        uploaded_file.save(path)
+    except OSError as e:
+        job_store.abandon(job_id, str(e))
+        raise
+    job_store.start(job_id, run_validation_job, str(path), document_id, profile.name, revision)
+
+    status_url = url_for('job_status', job_id=job_id, _external=True)
+    response = jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": status_url,
+        "events_url": url_for('job_events', job_id=job_id, _external=True)
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+def job_result(job):
+    """Finished results of a done job, cached like synchronous results"""
+    profile = get_profile(job["profile"])
+    cache_key = ResultCache.key(job["document_id"], ruleset_id(profile))
+    results = cached_results(cache_key, job["document_id"])
+    if results is None:
+        results = finish_results(job_store.result(job["id"]), job["document_id"], profile)
+        cache_results(job["document_id"], profile, results)
+        # The diff is not cached, so keep it with the job
+        if "revision" in results:
+            job_store.update(job["id"], revision=results["revision"])
+    elif "revision" in job:
+        results["revision"] = job["revision"]
+    return results
+
+def find_job(job_id):
+    job = job_store.get(job_id) if JobStore.valid_id(job_id) else None
+    if job is None:
+        abort(404)
+    return job
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = find_job(job_id)
+    if job["status"] == "done":
+        job["result"] = shape_results(job_result(job))
+    return negotiated_response(job)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events: 'progress' whenever the job changes, then 'result' when done"""
+    job = find_job(job_id)
+
+    def generate():
+        last = None
+        current = job
+        deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        while current is not None and time.monotonic() < deadline:
+            if current != last:
+                yield f"event: progress\ndata: {json.dumps(current)}\n\n"
+                last = current
+            if current["status"] == "done":
+                yield f"event: result\ndata: {json.dumps(shape_results(job_result(current)))}\n\n"
+                return
+            if current["status"] == "failed":
+                return
+            time.sleep(JOB_EVENTS_INTERVAL)
+            current = job_store.get(job_id)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+def error_message(exc):
+    if isinstance(exc, (zipfile.BadZipFile, InvalidDocument)):
+        return "Invalid DOCX file structure"
+    return str(exc)
+
+@app.route('/validate/batch', methods=['POST'])
+def validate_batch():
+    """Validate many .docx files (or one .zip of them), streaming one NDJSON line per file"""
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    if not uploads:
+        return jsonify({"error": "No file uploaded"}), 400
+    try:
+        profile = requested_profile()
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not janitor.has_room():
+        return storage_full()
+    folder = workspaces.create('batch')
+    ruleset = ruleset_id(profile)
+    # A broken pool is replaced at most once per batch; after that its files fail
+    replacements = [1]
+
+    def submit(path, document_id):
+        """(pool, future) of the document's validation, which holds an admission slot until it finishes"""
+        args = (validate_docx_file, str(path), document_id, media_store.root)
+        # Like a background job, a batch waits its turn rather than being refused part way through
+        admission.acquire(bounded=False)
+        try:
+            pool = get_pool()
+            try:
+                future = pool.submit(*args, profile=profile.name)
+            except BrokenProcessPool:
+                reset_pool(pool)
+                if not replacements:
+                    raise
+                replacements.pop()
+                pool = get_pool()
+                future = pool.submit(*args, profile=profile.name)
+        except BaseException:
+            admission.release()
+            raise
+        future.add_done_callback(lambda _: admission.release())
+        return pool, future
+
+    def generate():
+        counts = {"ok": 0, "failed": 0}
+
+        def record(name, document_id=None, results=None, error=None):
+            counts["failed" if error else "ok"] += 1
+            if error:
+                line = {"file": name, "status": "error", "error": error}
+            else:
+                line = {"file": name, "status": "ok", "document_id": document_id, "results": shape_results(results)}
+            return json.dumps(line) + "\n"
+
+        try:
+            pending = {}
+            for name, path, document_id, error in spool_batch(uploads, folder):
+                if error:
+                    yield record(name, error=error)
+                    continue
+                cache_key = ResultCache.key(document_id, ruleset)
+                results = cached_results(cache_key, document_id)
+                if results is not None:
+                    yield record(name, document_id, results)
+                    continue
+                try:
+                    pool, future = submit(path, document_id)
+                except BrokenProcessPool:
+                    yield record(name, error="Validation worker crashed")
+                    continue
+                pending[future] = (name, document_id, pool)
+
+            # Results are streamed in completion order; one bad file only fails its own line
+            for future in as_completed(pending):
+                name, document_id, pool = pending[future]
+                try:
+                    results = finish_results(future.result(), document_id, profile)
+                except BrokenProcessPool:
+                    reset_pool(pool)
+                    yield record(name, error="Validation worker crashed")
+                    continue
+                except Exception as e:
+                    yield record(name, error=error_message(e))
+                    continue
+                cache_results(document_id, profile, results)
+                yield record(name, document_id, results)
+
+            yield json.dumps({"summary": dict(counts, total=counts["ok"] + counts["failed"])}) + "\n"
+        finally:
+            workspaces.remove(folder)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+def send_media(path, etag):
+    response = send_file(path, mimetype=DocumentMedia.content_type(path), etag=etag,
+                         max_age=MEDIA_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/documents/<document_id>/media/<digest>', methods=['GET'])
+def document_media(document_id, digest):
+    try:
+        path = media_store.document(document_id).path(digest)
+    except ValueError:
+        abort(404)
+    if path is None:
+        abort(404)
+    return send_media(path, digest)
+
+@app.route('/documents/<document_id>/media/<digest>/thumbnail', methods=['GET'])
+def document_media_thumbnail(document_id, digest):
+    try:
+        path = media_store.document(document_id).thumbnail(digest)
+    except ValueError:
+        abort(404)
+    if path is None:
+        abort(404)
+    return send_media(path, path.name)
+
+@app.route('/documents/<document_id>/content', methods=['GET'])
+def document_content(document_id):
+    """Rendered paragraphs ?from= to ?to= (1-based, inclusive) of a document validated with ?content=pages"""
+    try:
+        profile = requested_profile()
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        media = media_store.document(document_id)
+    except ValueError:
+        abort(404)
+    ruleset = ruleset_id(profile)
+    pages = PagedContent(media.folder, ruleset)
+    count = pages.count()
+    if count is None:
+        return jsonify({"error": "No stored content for this document; validate it again"}), 404
+
+    first = request.args.get('from', 1, type=int)
+    last = request.args.get('to', first + CONTENT_PAGE_LIMIT - 1, type=int)
+    if first < 1 or last < first:
+        return jsonify({"error": "'from' must be at least 1 and 'to' at least 'from'"}), 400
+    if first > count:
+        return jsonify({"error": f"The document has {count} paragraphs", "paragraph_count": count}), 416
+    last = min(last, first + CONTENT_PAGE_LIMIT - 1, count)
+
+    # A document's rendering never changes for a ruleset, so the range identifies the page
+    etag = f"{ruleset}-{first}-{last}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        media.touch()
+        response = negotiated_response({
+            "document_id": document_id,
+            "profile": profile.name,
+            "from": first,
+            "to": last,
+            "paragraph_count": count,
+            "content": pages.read(first, last),
+        })
+    # Weak, since the bytes depend on the negotiated format and coding. The
+    # ruleset can change under the same URL, so caches always revalidate.
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify([profile.describe() for profile in PROFILES.values()]), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage and rule timings, document counts and admission state in the Prometheus text format"""
+    serving = admission.stats()
+    extra = [
+        ('validator_in_flight', 'gauge', 'Validations running now', serving["in_flight"]),
+        ('validator_queue_depth', 'gauge', 'Validations waiting for a slot', serving["queued"]),
+        ('validator_admitted_total', 'counter', 'Validations given a slot', serving["admitted"]),
+        ('validator_rejected_queue_full_total', 'counter', 'Validations refused because the queue was full',
+         serving["rejected_queue_full"]),
+        ('validator_rejected_timeout_total', 'counter', 'Validations refused after waiting too long',
+         serving["rejected_timeout"]),
+        ('validator_queue_wait_seconds_total', 'counter', 'Time validations spent waiting for a slot',
+         serving["queue_wait_seconds"]),
+    ]
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/serving/stats', methods=['GET'])
+def serving_stats():
+    return jsonify(dict(admission.stats(), jobs=job_store.stats())), 200
+
+@app.route('/storage/stats', methods=['GET'])
+def storage_stats():
+    return jsonify(janitor.stats()), 200
+
 @app.route('/')
 def index():
     return jsonify({"status": "Backend API is running"}), 200
 
 # === MAIN RUNNER ===
 if __name__ == '__main__':
+    janitor.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
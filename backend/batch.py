@@ -0,0 +1,93 @@
+"""Batch validation of many DOCX files over a process pool."""
+import hashlib
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from werkzeug.utils import secure_filename
+
+from safe_zip import ArchiveTooLarge, BoundedZipFile
+
+# Every gunicorn worker has a pool of its own, so by default they share out the cores
+BATCH_POOL_SIZE = int(os.environ.get(
+    'BATCH_POOL_SIZE', max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The shared worker pool, created on first use (and again after a worker crash)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=BATCH_POOL_SIZE)
+        return _pool
+
+
+def start_pool():
+    """Create the pool and fork its processes now, before the caller starts any threads"""
+    get_pool().submit(int).result()
+
+
+def reset_pool(pool):
+    """Drop ``pool``, found broken by a worker crash, so the next get_pool() starts a new one
+
+    Requests that shared the broken pool all see the crash; only the first
+    resets it, so a fresh pool another request is already using is left alone.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _spool(stream, name, folder, index):
+    """Copy ``stream`` to a numbered file in ``folder``, hashing it on the way"""
+    path = Path(folder) / f"{index:05d}_{secure_filename(name) or 'document.docx'}"
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while chunk := stream.read(1 << 20):
+            digest.update(chunk)
+            f.write(chunk)
+    return path, digest.hexdigest()
+
+
+def spool_batch(uploads, folder):
+    """Write every uploaded .docx, or every .docx inside an uploaded .zip, to ``folder``
+
+    Yields ``(name, path, document_id, error)``; a file that cannot be read
+    yields an error instead of stopping the batch.
+    """
+    index = 0
+    for upload in uploads:
+        name = upload.filename or ''
+        lower = name.lower()
+        if lower.endswith('.docx'):
+            index += 1
+            yield (name, *_spool(upload.stream, name, folder, index), None)
+        elif lower.endswith('.zip'):
+            try:
+                with BoundedZipFile(upload.stream) as archive:
+                    for info in archive.infolist():
+                        member = PurePosixPath(info.filename)
+                        if info.is_dir() or member.suffix.lower() != '.docx' or '__MACOSX' in member.parts:
+                            continue
+                        index += 1
+                        try:
+                            with archive.open(info) as member_stream:
+                                spooled = _spool(member_stream, member.name, folder, index)
+                        except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+                            yield info.filename, None, None, f"Could not read file from archive: {e}"
+                            continue
+                        yield (info.filename, *spooled, None)
+            except zipfile.BadZipFile:
+                yield name, None, None, "Invalid ZIP archive"
+            except ArchiveTooLarge as e:
+                yield name, None, None, str(e)
+        else:
+            yield name, None, None, "Only .docx files or a .zip of them are allowed"
@@ -0,0 +1,130 @@
+"""Benchmark the validation pipeline stage by stage on generated documents.
+
+For each scale a document is generated (see docx_generator.py) and
+validated with validate_docx_file. The time of every stage and rule is
+read from the metrics the pipeline records, JSON serialization is timed
+here, and peak memory is measured with tracemalloc in a second run.
+
+    cd backend && python benchmarks/bench_pipeline.py                   # report
+    cd backend && python benchmarks/bench_pipeline.py --save-baseline   # record this tree
+    cd backend && python benchmarks/bench_pipeline.py --check           # exit 1 on regressions
+
+A stage regresses when it is both ``--tolerance`` (relative) and
+``--min-seconds`` (absolute) slower than the baseline; peak memory when it
+is ``--tolerance`` and ``--min-mb`` larger. Baselines are machine-specific.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_generator import DocumentSpec, generate  # noqa: E402
+from Validation import RULE_SECONDS, STAGE_SECONDS, validate_docx_file  # noqa: E402
+
+SCALES = (10, 1000, 100000)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DOCUMENT_ID = '0' * 64
+
+
+def snapshot():
+    sums = {f"stage:{stage}": STAGE_SECONDS.totals(stage)[1] for stage in STAGE_SECONDS.values}
+    sums.update((f"rule:{rule}", RULE_SECONDS.totals(rule)[1]) for rule in RULE_SECONDS.values)
+    return sums
+
+
+def measure(path, media_root):
+    """Seconds per stage and rule for one validation of ``path``"""
+    before = snapshot()
+    results = validate_docx_file(path, DOCUMENT_ID, media_root)
+    timings = {name: seconds - before[name] for name, seconds in snapshot().items()}
+    start = time.perf_counter()
+    json.dumps(results)
+    timings["stage:serialize"] = time.perf_counter() - start
+    return {name: round(seconds, 4) for name, seconds in timings.items() if seconds or name == "stage:total"}
+
+
+def peak_memory_mb(path, media_root):
+    tracemalloc.start()
+    try:
+        validate_docx_file(path, DOCUMENT_ID, media_root)
+        return round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run(scales, memory=True):
+    report = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for paragraphs in scales:
+            path = os.path.join(folder, f'{paragraphs}.docx')
+            generate(DocumentSpec(paragraphs=paragraphs, images=min(paragraphs // 10, 500)), path)
+            entry = {"bytes": os.path.getsize(path), "seconds": measure(path, folder)}
+            if memory:
+                entry["peak_mb"] = peak_memory_mb(path, folder)
+            report[str(paragraphs)] = entry
+            print_entry(paragraphs, entry)
+    return report
+
+
+def print_entry(paragraphs, entry):
+    print(f"{paragraphs} paragraphs, {entry['bytes']} bytes"
+          + (f", peak {entry['peak_mb']} MB" if "peak_mb" in entry else ""))
+    for name, seconds in sorted(entry["seconds"].items()):
+        print(f"  {name:<28} {seconds:10.4f} s")
+
+
+def regressions(report, baseline, tolerance, min_seconds, min_mb):
+    found = []
+    for scale, entry in report.items():
+        base = baseline.get(scale)
+        if base is None:
+            continue
+        for name, seconds in entry["seconds"].items():
+            old = base["seconds"].get(name)
+            if old is not None and seconds > old * (1 + tolerance) and seconds - old > min_seconds:
+                found.append(f"{scale} paragraphs: {name} took {seconds:.4f}s, baseline {old:.4f}s")
+        old, peak = base.get("peak_mb"), entry.get("peak_mb")
+        if old is not None and peak is not None and peak > old * (1 + tolerance) and peak - old > min_mb:
+            found.append(f"{scale} paragraphs: peak memory {peak} MB, baseline {old} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-seconds', type=float, default=0.05)
+    parser.add_argument('--min-mb', type=float, default=5)
+    args = parser.parse_args()
+
+    # Checked before the run, which can take minutes; baselines are machine-specific, so none is committed
+    if args.check and not args.save_baseline and not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+
+    report = run(args.scales, memory=not args.no_memory)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.tolerance, args.min_seconds, args.min_mb)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark HTML rendering of documents with many flagged words.
+
+Renders a synthetic document whose whole body uses the wrong font, once
+with the (paragraph, offset) index used by ContentRenderRule and once with
+the old lookup that scanned every word error and reference per word.
+
+    cd backend && python benchmarks/bench_render.py
+"""
+import io
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Validation import (  # noqa: E402
+    DOCUMENT_PART, W, WORD_PATTERN, ContentRenderRule, ImageReferenceRule, ValidationContext,
+    ValidationEngine, WordFormattingRule, html,
+)
+
+WORDS = "The quick brown fox jumps over the lazy dog".split()
+
+
+def build_docx(paragraphs, runs_per_paragraph=3):
+    """Build an in-memory DOCX where every run is set in Arial"""
+    run = (
+        '<w:r><w:rPr><w:rFonts w:ascii="Arial" w:hAnsi="Arial"/><w:sz w:val="24"/></w:rPr>'
+        f'<w:t xml:space="preserve">{" ".join(WORDS)} </w:t></w:r>'
+    )
+    para = f'<w:p><w:pPr><w:jc w:val="both"/></w:pPr>{run * runs_per_paragraph}</w:p>'
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{W}"><w:body>'
+        f'{para * paragraphs}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr(DOCUMENT_PART, document)
+    buffer.seek(0)
+    return buffer
+
+
+class ScanningContentRenderRule(ContentRenderRule):
+    """The pre-index renderer: scans all errors and references for every word
+
+    Word errors were kept one entry per flagged word, keyed by word id, and
+    this renderer scanned all of them for each word. The spans are expanded
+    back into such a dict as paragraphs arrive, so the scan is as long as it
+    was before spans merged the words of a run.
+    """
+
+    def start(self, ctx):
+        super().start(ctx)
+        self.word_errors = {}
+
+    def paragraph(self, ctx, para):
+        spans = [span for span in ctx.word_errors.spans if span[0] == para.index]
+        words = []
+        run_end = 0
+        for _, run_text in para.runs:
+            run_start = run_end
+            run_end += len(run_text)
+            words.append([(match.group(), run_start + match.start()) for match in WORD_PATTERN.finditer(run_text)])
+        for _, position in (word for run_words in words for word in run_words):
+            for _, start, end, code in spans:
+                if start <= position < end:
+                    self.word_errors[f"word_{para.index}_{position}"] = {
+                        "paragraph": para.index, "position": position, "code": code,
+                    }
+
+        parts = ["<p>"]
+        for run_words in words:
+            for i, (word, position) in enumerate(run_words):
+                if i:
+                    parts.append(" ")
+                error_word_id = next(
+                    (word_id for word_id, info in self.word_errors.items()
+                     if info["paragraph"] == para.index and info["position"] == position),
+                    None,
+                )
+                ref_info = next(
+                    (ref for ref in ctx.image_references
+                     if ref["paragraph"] == para.index
+                     and ref["position"] <= position < ref["position"] + len(ref["reference"])),
+                    None,
+                )
+                if error_word_id:
+                    parts.append(f'<span id="{error_word_id}" class="doc-word error-word">{html.escape(word)}</span>')
+                elif ref_info:
+                    parts.append((ref_info, html.escape(word)))
+                else:
+                    parts.append(html.escape(word))
+        parts.append("</p>")
+        self.content.append(parts)
+
+
+def run(paragraphs, renderer):
+    docx_bytes = build_docx(paragraphs)
+    rules = [WordFormattingRule(), ImageReferenceRule(), renderer]
+    with zipfile.ZipFile(docx_bytes) as docx:
+        ctx = ValidationContext(docx)
+        start = time.perf_counter()
+        with docx.open(DOCUMENT_PART) as document_xml:
+            ValidationEngine(rules).run(document_xml, ctx)
+        elapsed = time.perf_counter() - start
+    return elapsed, ctx.font_error_words
+
+
+def main():
+    print(f"{'paragraphs':>10} {'flagged':>8} {'indexed (s)':>12} {'scanning (s)':>13}")
+    for paragraphs in (50, 200, 800, 5000):
+        indexed, flagged = run(paragraphs, ContentRenderRule())
+        # The scanning renderer is quadratic: about ten seconds at 800 paragraphs, minutes at 5000
+        scanning = f"{run(paragraphs, ScanningContentRenderRule())[0]:13.3f}" if paragraphs <= 800 else f"{'-':>13}"
+        print(f"{paragraphs:>10} {flagged:>8} {indexed:12.3f} {scanning}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark the size and serialization time of word_errors.
+
+Validates a synthetic document whose whole body uses the wrong font and
+serializes its word errors as spans over a message table, in columns, and
+in the old format with one entry (and a copy of the messages) per word.
+
+    cd backend && python benchmarks/bench_word_errors.py
+"""
+import json
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_render import build_docx  # noqa: E402
+from Validation import (  # noqa: E402
+    DOCUMENT_PART, WORD_PATTERN, Rule, ValidationContext, ValidationEngine, WordFormattingRule,
+    columnar_word_errors,
+)
+
+
+class TextRule(Rule):
+    """Keep every paragraph's text, to expand spans into words"""
+
+    def start(self, ctx):
+        self.texts = {}
+
+    def paragraph(self, ctx, para):
+        self.texts[para.index] = para.text
+
+
+def per_word(word_errors, texts):
+    """The old format: word id -> {word, paragraph, position, errors}"""
+    legacy = {}
+    for paragraph, start, end, code in word_errors.spans:
+        for match in WORD_PATTERN.finditer(texts[paragraph], start, end):
+            legacy[f"word_{len(legacy):08x}"] = {
+                "word": match.group(),
+                "paragraph": paragraph,
+                "position": match.start(),
+                "errors": word_errors.errors(code),
+            }
+    return legacy
+
+
+def timed_dumps(value, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = json.dumps(value)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(data), best
+
+
+def run(paragraphs):
+    texts = TextRule()
+    with zipfile.ZipFile(build_docx(paragraphs)) as docx:
+        ctx = ValidationContext(docx)
+        with docx.open(DOCUMENT_PART) as document_xml:
+            ValidationEngine([WordFormattingRule(), texts]).run(document_xml, ctx)
+    spans = ctx.word_errors.to_json()
+    return {
+        "words": timed_dumps(per_word(ctx.word_errors, texts.texts)),
+        "spans": timed_dumps(spans),
+        "columns": timed_dumps(columnar_word_errors(spans)),
+    }
+
+
+def main():
+    print(f"{'paragraphs':>10} {'format':>8} {'bytes':>12} {'dumps (s)':>10}")
+    for paragraphs in (200, 5000, 50000):
+        for name, (size, elapsed) in run(paragraphs).items():
+            print(f"{paragraphs:>10} {name:>8} {size:>12} {elapsed:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Check that the lxml and ElementTree backends give identical results, and compare their speed.
+
+Each document is validated once per backend, in a child process started
+with ``XML_BACKEND`` set (the backend is chosen at import). The children
+report a hash of the JSON results and the best of ``--repeat`` timings.
+
+    cd backend && python benchmarks/bench_xml_backends.py                  # generated documents
+    cd backend && python benchmarks/bench_xml_backends.py thesis.docx -r 5
+
+Exits 1 if any document's results differ between the backends; with
+``--diff DIR`` both results are written there for comparison.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from docx_generator import DocumentSpec, generate  # noqa: E402
+
+BACKENDS = ('etree', 'lxml')
+SCALES = (1000, 20000)
+
+
+def child(path, repeat, output=None):
+    """Validate ``path`` with the backend in XML_BACKEND and print seconds and a results hash"""
+    from Validation import open_docx, validate_docx_structure
+    from xml_backend import XML_BACKEND
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open_docx(path) as docx:
+            results = validate_docx_structure(docx)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    encoded = json.dumps(results, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(encoded)
+    print(json.dumps({
+        "backend": XML_BACKEND,
+        "seconds": round(best, 4),
+        "sha256": hashlib.sha256(encoded.encode('utf-8')).hexdigest(),
+    }))
+
+
+def run_backend(backend, path, repeat, output=None):
+    command = [sys.executable, os.path.abspath(__file__), '--child', path, '--repeat', str(repeat)]
+    if output:
+        command += ['--output', output]
+    completed = subprocess.run(command, env=dict(os.environ, XML_BACKEND=backend), cwd=BACKEND_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"{backend} failed on {path}:\n{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def compare(paths, repeat, diff=None):
+    mismatches = 0
+    for path in paths:
+        name = os.path.basename(path)
+        reports = {}
+        for backend in BACKENDS:
+            output = os.path.join(diff, f'{name}.{backend}.json') if diff else None
+            reports[backend] = run_backend(backend, path, repeat, output)
+        same = len({report["sha256"] for report in reports.values()}) == 1
+        mismatches += not same
+        etree_seconds, lxml_seconds = (reports[backend]["seconds"] for backend in BACKENDS)
+        print(f"{name:<24} etree {etree_seconds:8.3f} s  lxml {lxml_seconds:8.3f} s  "
+              f"x{etree_seconds / lxml_seconds:5.2f}  {'identical' if same else 'DIFFERENT'}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('documents', nargs='*', help=".docx files (default: generated documents)")
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--diff', help="folder to write both backends' results to")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.repeat, args.output)
+        return
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        sys.exit("lxml is not installed; nothing to compare")
+    if args.diff:
+        os.makedirs(args.diff, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.abspath(path) for path in args.documents]
+        if not paths:
+            for paragraphs in args.scales:
+                path = os.path.join(folder, f'{paragraphs}.docx')
+                generate(DocumentSpec(paragraphs=paragraphs, images=min(paragraphs // 10, 500)), path)
+                paths.append(path)
+        mismatches = compare(paths, args.repeat, args.diff)
+    if mismatches:
+        print(f"{mismatches} document(s) differ between the backends")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Generate synthetic .docx files for benchmarks.
+
+Documents have a chosen number of paragraphs and runs per paragraph, a
+share of runs in the wrong font or size, a share of unjustified
+paragraphs, embedded images and figure references, and optionally
+header/footer pairs and footnotes, whose runs break the same shares. The output is
+deterministic for a given seed.
+
+    cd backend && python benchmarks/docx_generator.py out.docx --paragraphs 1000 --images 20
+"""
+import argparse
+import io
+import random
+import struct
+import zipfile
+import zlib
+from dataclasses import dataclass
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+PIC = 'http://schemas.openxmlformats.org/drawingml/2006/picture'
+WP = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+IMAGE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+WORDS = ("the report covers training outcomes for each unit together with the schedule "
+         "resources and lessons learnt during the exercise period").split()
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    f'<w:styles xmlns:w="{W}"><w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:cs="Times New Roman"/>'
+    '<w:sz w:val="24"/><w:szCs w:val="24"/></w:rPr></w:rPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '</w:styles>'
+)
+SECTION = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840" w:orient="portrait"/>'
+    '<w:pgMar w:top="1418" w:right="1418" w:bottom="1418" w:left="1418" '
+    'w:header="567" w:footer="567" w:gutter="0"/></w:sectPr>'
+)
+
+
+@dataclass
+class DocumentSpec:
+    paragraphs: int = 1000
+    runs_per_paragraph: int = 3
+    words_per_run: int = 6
+    # Shares of runs (fonts, sizes) and paragraphs (the rest)
+    font_violations: float = 0.1
+    size_violations: float = 0.1
+    unjustified: float = 0.05
+    figure_references: float = 0.02
+    images: int = 10
+    # Header and footer pairs, and footnotes
+    headers: int = 0
+    footnotes: int = 0
+    seed: int = 0
+
+
+def png(width, height, rgb):
+    """A solid-colour PNG"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = b'\x00' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height))
+            + chunk(b'IEND', b''))
+
+
+def _run(text, font=None, size=None):
+    props = ''
+    if font:
+        props += f'<w:rFonts w:ascii="{font}" w:hAnsi="{font}"/>'
+    if size:
+        props += f'<w:sz w:val="{size}"/>'
+    props = f'<w:rPr>{props}</w:rPr>' if props else ''
+    return f'<w:r>{props}<w:t xml:space="preserve">{text} </w:t></w:r>'
+
+
+def _drawing(rel_id, number):
+    return (
+        f'<w:r><w:drawing><wp:inline><wp:docPr id="{number}" name="Picture {number}"/>'
+        f'<a:graphic><a:graphicData uri="{PIC}"><pic:pic><pic:blipFill>'
+        f'<a:blip r:embed="{rel_id}"/></pic:blipFill></pic:pic></a:graphicData></a:graphic>'
+        '</wp:inline></w:drawing></w:r>'
+    )
+
+
+def document_xml(spec, rng):
+    """document.xml for ``spec``, with images placed at even intervals"""
+    image_every = max(spec.paragraphs // spec.images, 1) if spec.images else 0
+    images = 0
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{W}" xmlns:r="{R}" xmlns:a="{A}" xmlns:pic="{PIC}" xmlns:wp="{WP}"><w:body>'
+    ]
+    for index in range(spec.paragraphs):
+        jc = '' if rng.random() < spec.unjustified else '<w:jc w:val="both"/>'
+        parts.append(f'<w:p><w:pPr>{jc}</w:pPr>')
+        for _ in range(spec.runs_per_paragraph):
+            text = ' '.join(rng.choice(WORDS) for _ in range(spec.words_per_run))
+            if rng.random() < spec.figure_references:
+                text += f' as shown in Figure {rng.randint(1, max(spec.images, 1) + 2)}'
+            font = 'Arial' if rng.random() < spec.font_violations else None
+            size = '22' if rng.random() < spec.size_violations else None
+            parts.append(_run(text, font, size))
+        if image_every and images < spec.images and index % image_every == 0:
+            images += 1
+            parts.append(_drawing(f'rIdImg{images}', images))
+        parts.append('</w:p>')
+    parts.append(SECTION + '</w:body></w:document>')
+    return ''.join(parts), images
+
+
+def _runs(spec, rng):
+    parts = []
+    for _ in range(spec.runs_per_paragraph):
+        text = ' '.join(rng.choice(WORDS) for _ in range(spec.words_per_run))
+        font = 'Arial' if rng.random() < spec.font_violations else None
+        size = '22' if rng.random() < spec.size_violations else None
+        parts.append(_run(text, font, size))
+    return ''.join(parts)
+
+
+def text_parts(spec, rng):
+    """{part name: XML} of the header, footer and footnote parts for ``spec``"""
+    parts = {}
+    for n in range(1, spec.headers + 1):
+        for kind, root in (('header', 'hdr'), ('footer', 'ftr')):
+            parts[f'word/{kind}{n}.xml'] = (
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:{root} xmlns:w="{W}">'
+                f'<w:p><w:pPr><w:pStyle w:val="{kind.title()}"/></w:pPr>{_runs(spec, rng)}</w:p></w:{root}>'
+            )
+    if spec.footnotes:
+        notes = ''.join(
+            f'<w:footnote w:id="{n}"><w:p><w:pPr><w:pStyle w:val="FootnoteText"/></w:pPr>{_runs(spec, rng)}</w:p>'
+            '</w:footnote>'
+            for n in range(1, spec.footnotes + 1)
+        )
+        parts['word/footnotes.xml'] = (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:footnotes xmlns:w="{W}">'
+            '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+            f'{notes}</w:footnotes>'
+        )
+    return parts
+
+
+def generate(spec, target=None):
+    """Write a .docx for ``spec`` to ``target`` (a path or file object; a new BytesIO if None)"""
+    rng = random.Random(spec.seed)
+    if target is None:
+        target = io.BytesIO()
+    document, images = document_xml(spec, rng)
+    rels = ''.join(
+        f'<Relationship Id="rIdImg{n}" Type="{IMAGE_REL}" Target="media/image{n}.png"/>'
+        for n in range(1, images + 1)
+    )
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', CONTENT_TYPES)
+        docx.writestr('_rels/.rels', PACKAGE_RELS)
+        docx.writestr('word/document.xml', document)
+        docx.writestr('word/styles.xml', STYLES)
+        for name, xml in text_parts(spec, rng).items():
+            docx.writestr(name, xml)
+        docx.writestr(
+            'word/_rels/document.xml.rels',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}'
+            '</Relationships>'
+        )
+        for n in range(1, images + 1):
+            docx.writestr(f'word/media/image{n}.png', png(64, 48, (n * 37 % 256, n * 91 % 256, n * 13 % 256)))
+    if isinstance(target, io.BytesIO):
+        target.seek(0)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    defaults = DocumentSpec()
+    for field, value in vars(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    output = args.pop('output')
+    generate(DocumentSpec(**args), output)
+
+
+if __name__ == '__main__':
+    main()
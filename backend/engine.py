@@ -0,0 +1,214 @@
+"""Single-pass streaming validation engine.
+
+document.xml is read once with ``iterparse``. Every paragraph is handed to
+the registered rules as soon as it has been parsed, then cleared, so memory
+stays flat no matter how long the document is.
+"""
+from time import perf_counter
+
+from xml_backend import Path, Text, detach, iterparse
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+NS = {'w': W}
+
+W_BODY = f'{{{W}}}body'
+W_P = f'{{{W}}}p'
+W_SECTPR = f'{{{W}}}sectPr'
+W_VAL = f'{{{W}}}val'
+
+RUNS = Path('.//w:r', NS)
+TEXT = Text('.//w:t', NS)
+PARAGRAPH_STYLE = Path('w:pPr/w:pStyle', NS)
+
+
+class Paragraph:
+    """A parsed paragraph as seen by the rules"""
+
+    __slots__ = ('index', 'element', 'nested', '_runs', '_text', '_style', 'digest', 'reused')
+
+    def __init__(self, index, element, nested=False):
+        self.index = index
+        self.element = element
+        # True for paragraphs inside another paragraph (e.g. text boxes)
+        self.nested = nested
+        self._runs = None
+        self._text = None
+        self._style = False
+        # Set by incremental validation: the paragraph's fingerprint, and the
+        # results of an unchanged earlier paragraph to reuse (revisions.Reused)
+        self.digest = None
+        self.reused = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = TEXT(self.element)
+        return self._text
+
+    @property
+    def style(self):
+        """The paragraph style id (w:pStyle), or None"""
+        if self._style is False:
+            style = PARAGRAPH_STYLE.first(self.element)
+            self._style = style.get(W_VAL) if style is not None else None
+        return self._style
+
+    @property
+    def runs(self):
+        """List of (run element, run text) pairs, computed once per paragraph"""
+        if self._runs is None:
+            self._runs = [(run, TEXT(run)) for run in RUNS.all(self.element)]
+        return self._runs
+
+
+class Rule:
+    """Base class for rule plug-ins; override only the hooks you need"""
+
+    name = 'rule'
+
+    def start(self, ctx):
+        pass
+
+    def section(self, ctx, sect_pr):
+        pass
+
+    def paragraph(self, ctx, para):
+        pass
+
+    def finish(self, ctx):
+        pass
+
+
+class TimedRule(Rule):
+    """Wrap a rule to add the seconds spent in its hooks to ``timings[rule.name]``"""
+
+    def __init__(self, rule, timings):
+        self.rule = rule
+        self.name = rule.name
+        self.timings = timings
+        timings.setdefault(rule.name, 0.0)
+
+    def start(self, ctx):
+        start = perf_counter()
+        self.rule.start(ctx)
+        self.timings[self.name] += perf_counter() - start
+
+    def section(self, ctx, sect_pr):
+        start = perf_counter()
+        self.rule.section(ctx, sect_pr)
+        self.timings[self.name] += perf_counter() - start
+
+    def paragraph(self, ctx, para):
+        start = perf_counter()
+        self.rule.paragraph(ctx, para)
+        self.timings[self.name] += perf_counter() - start
+
+    def finish(self, ctx):
+        start = perf_counter()
+        self.rule.finish(ctx)
+        self.timings[self.name] += perf_counter() - start
+
+
+class ShardRule(Rule):
+    """Wrap a rule to show it only paragraphs ``first`` to ``last`` (exclusive; None for the rest)
+
+    Start, section and finish hooks are passed through, so a rule sharded
+    across processes still sets up and finishes on its own shard.
+    """
+
+    def __init__(self, rule, first, last=None):
+        self.rule = rule
+        self.name = rule.name
+        self.first = first
+        self.last = last
+
+    def start(self, ctx):
+        self.rule.start(ctx)
+
+    def section(self, ctx, sect_pr):
+        self.rule.section(ctx, sect_pr)
+
+    def paragraph(self, ctx, para):
+        if para.index >= self.first and (self.last is None or para.index < self.last):
+            self.rule.paragraph(ctx, para)
+
+    def finish(self, ctx):
+        self.rule.finish(ctx)
+
+
+class ValidationEngine:
+    """Visit each paragraph once and dispatch it to every registered rule
+
+    When ``timings`` is a dict, the seconds each rule takes are added to it
+    under the rule's name.
+    """
+
+    def __init__(self, rules=(), timings=None):
+        self.rules = list(rules)
+        self.timings = timings
+
+    def register(self, rule):
+        self.rules.append(rule)
+        return rule
+
+    def run(self, source, ctx):
+        """Stream ``source`` (path or file object of document.xml) through the rules"""
+        for _ in self.iterate(source, ctx):
+            pass
+        return ctx
+
+    def iterate(self, source, ctx):
+        """Like run(), but yield each Paragraph once every rule has seen it
+
+        The paragraph's element is cleared as soon as the caller resumes.
+        """
+        rules = self.rules
+        if self.timings is not None:
+            rules = [TimedRule(rule, self.timings) for rule in rules]
+        for rule in rules:
+            rule.start(ctx)
+
+        parents = []
+        para_depth = 0
+        para_index = 0
+
+        for event, elem in iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == W_P:
+                    para_depth += 1
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            tag = elem.tag
+            parent = parents[-1] if parents else None
+
+            if tag == W_SECTPR:
+                for rule in rules:
+                    rule.section(ctx, elem)
+
+            if tag == W_P:
+                para_depth -= 1
+                if para_depth:
+                    continue
+                # Paragraphs nested in text boxes are visited right after their
+                # outer paragraph, matching document order
+                for nested, p in enumerate(elem.iter(W_P)):
+                    para_index += 1
+                    para = Paragraph(para_index, p, nested=bool(nested))
+                    for rule in rules:
+                        rule.paragraph(ctx, para)
+                    yield para
+                release = True
+            else:
+                # Anything else directly under the body (tables, sections,
+                # bookmarks) is done with once it ends
+                release = parent is not None and parent.tag == W_BODY and not para_depth
+
+            if release:
+                elem.clear()
+                if parent is not None:
+                    detach(parent, elem)
+
+        for rule in rules:
+            rule.finish(ctx)
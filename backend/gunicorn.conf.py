@@ -0,0 +1,44 @@
+"""Production serving: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and the workers are forked from
+it, sharing the admission counters (see admission.py). Each worker serves
+requests on a few threads so streaming responses and job event polls do
+not tie up a whole process; how many validations actually run at once is
+set by MAX_INFLIGHT_VALIDATIONS, not by the worker count.
+
+Nothing that starts threads runs in the master: each worker forks its
+pool processes (BATCH_POOL_SIZE, by default the cores divided between the
+workers) and starts the storage janitor once it has itself been forked.
+"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+preload_app = True
+# Exported so batch.py can divide the cores between the workers' pools
+workers = int(os.environ.setdefault('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+# Large documents take tens of seconds to validate
+timeout = int(os.environ.get('WEB_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to give back memory fragmented by big documents
+max_requests = 500
+max_requests_jitter = 50
+
+
+def post_fork(server, worker):
+    # Preloaded, so these are the worker's own copies of the app's modules
+    from app import janitor
+    from batch import start_pool
+    # Before the worker's request threads exist, so the pool is forked from a single thread
+    start_pool()
+    janitor.start()
+
+
+def child_exit(server, worker):
+    # A worker killed mid-validation never gave its admission slots back
+    from app import admission
+    reclaimed = admission.reclaim(worker.pid)
+    if reclaimed:
+        server.log.warning("Reclaimed %d validation slot(s) from worker %s", reclaimed, worker.pid)
@@ -0,0 +1,198 @@
+"""Asynchronous validation jobs with stage-level progress.
+
+Jobs run on a bounded thread pool in the process that accepted the upload.
+Their state is written to ``<folder>/<job id>.json`` (and the finished
+result to ``<job id>.result.json``) so any worker process can report on
+them.
+
+A job records the pid of the process running it, which touches the state
+file every ``JOB_HEARTBEAT_INTERVAL`` seconds while the job is queued or
+running. If that process has died, or its heartbeat is older than
+``JOB_STALE_SECONDS``, the job is marked failed the next time anyone
+reads it, instead of staying unfinished forever. The pid check assumes
+the workers share a host, as gunicorn's do.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+JOBS_FOLDER = 'jobs'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 16))
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 10))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 60))
+STALE_JOB_ERROR = "The server process running this job stopped; please upload the document again"
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """Runs jobs on a bounded pool and keeps their status on disk"""
+
+    def __init__(self, folder=JOBS_FOLDER, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT):
+        self.folder = Path(folder)
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._active = 0
+        # Ids of this process's unfinished jobs, kept alive by the heartbeat
+        self._owned = set()
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def _path(self, job_id, suffix='.json'):
+        return self.folder / f"{job_id}{suffix}"
+
+    @staticmethod
+    def valid_id(job_id):
+        return len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
+
+    def upload_path(self, job_id):
+        """Where the job's upload is spooled until it has been processed"""
+        return self._path(job_id, '.docx')
+
+    def create(self, **fields):
+        """Reserve a queue slot and record a new queued job; raises JobQueueFull when saturated"""
+        with self._lock:
+            if self._active >= self.queue_limit:
+                raise JobQueueFull()
+            self._active += 1
+            # Started here rather than at import, so it runs in the worker and not the gunicorn master
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+        self.folder.mkdir(parents=True, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        _write_json(self._path(job_id), dict(
+            fields, id=job_id, status='queued', stage='queued', progress=0.0,
+            error=None, created=now, updated=now, pid=os.getpid(),
+        ))
+        with self._lock:
+            self._owned.add(job_id)
+        return job_id
+
+    def _beat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            with self._lock:
+                owned = list(self._owned)
+            for job_id in owned:
+                try:
+                    os.utime(self._path(job_id))
+                except FileNotFoundError:
+                    pass
+
+    def abandon(self, job_id, error):
+        """Mark a job that never started as failed and free its queue slot"""
+        self.update(job_id, status='failed', error=error)
+        with self._lock:
+            self._active -= 1
+            self._owned.discard(job_id)
+
+    def start(self, job_id, fn, *args):
+        """Run ``fn(job, *args)`` on the pool, where ``job`` reports progress for this job"""
+        self._executor.submit(self._run, job_id, fn, args)
+
+    def _run(self, job_id, fn, args):
+        try:
+            self.update(job_id, status='running')
+            result = fn(JobProgress(self, job_id), *args)
+            _write_json(self._path(job_id, '.result.json'), result)
+            self.update(job_id, status='done', stage='done', progress=1.0)
+        except Exception as e:
+            self.update(job_id, status='failed', error=str(e))
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._owned.discard(job_id)
+
+    def update(self, job_id, **fields):
+        job = self._load(job_id) or {"id": job_id}
+        job.update(fields, updated=time.time())
+        _write_json(self._path(job_id), job)
+
+    def _load(self, job_id):
+        try:
+            return json.loads(self._path(job_id).read_text())
+        except FileNotFoundError:
+            return None
+
+    def get(self, job_id):
+        """The job's state, failing it first if the process running it has gone"""
+        job = self._load(job_id)
+        if job is not None and job.get("status") in ('queued', 'running') and self._orphaned(job_id, job):
+            self.update(job_id, status='failed', error=STALE_JOB_ERROR)
+            job = self._load(job_id)
+        return job
+
+    def _orphaned(self, job_id, job):
+        """Whether an unfinished job's process has died or stopped sending heartbeats"""
+        with self._lock:
+            if job_id in self._owned:
+                return False
+        pid = job.get("pid")
+        if pid is not None and pid != os.getpid() and not _alive(pid):
+            return True
+        try:
+            heartbeat = self._path(job_id).stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - heartbeat > JOB_STALE_SECONDS
+
+    def result(self, job_id):
+        try:
+            return json.loads(self._path(job_id, '.result.json').read_text())
+        except FileNotFoundError:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"active": self._active, "queue_limit": self.queue_limit}
+
+
+class JobProgress:
+    """Progress callback handed to a running job"""
+
+    # Progress writes are throttled so streaming large documents is not slowed down
+    min_interval = 0.25
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self._last = (None, 0.0)
+
+    def __call__(self, stage, fraction=None):
+        now = time.monotonic()
+        last_stage, last_time = self._last
+        if stage == last_stage and now - last_time < self.min_interval:
+            return
+        self._last = (stage, now)
+        self.store.update(self.job_id, stage=stage, progress=fraction)
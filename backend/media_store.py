@@ -0,0 +1,130 @@
+"""Content-addressed storage for document media.
+
+Images are written once per document under ``<root>/<document id>/<sha256>``
+and served by ``GET /documents/<id>/media/<hash>``. Because a file's name is
+the hash of its bytes it never changes, so it can be cached forever.
+"""
+import hashlib
+import os
+import re
+import struct
+import tempfile
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are optional; the original image is served instead
+    Image = None
+
+MEDIA_FOLDER = 'media'
+THUMBNAIL_SIZE = 256
+HEX_DIGEST = re.compile(r'[0-9a-f]{64}')
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_info(data):
+    """Return (content type, width, height) from an image header, or Nones if unknown"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'image/gif', width, height
+    if data[:2] == b'\xff\xd8':
+        return ('image/jpeg',) + _jpeg_size(data)
+    return None, None, None
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        # Start-of-frame markers carry the dimensions (C4, C8 and CC are not SOFs)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None, None
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class DocumentMedia:
+    """The media folder of a single document"""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def save(self, data):
+        """Store ``data`` under its SHA-256 and return the hex digest"""
+        digest = sha256_hex(data)
+        path = self.folder / digest
+        if not path.exists():
+            self.folder.mkdir(parents=True, exist_ok=True)
+            _write_atomic(path, data)
+        return digest
+
+    def path(self, digest):
+        if not HEX_DIGEST.fullmatch(digest):
+            return None
+        path = self.folder / digest
+        return path if path.is_file() else None
+
+    def touch(self):
+        """Mark the document's media as recently used, for the storage janitor"""
+        try:
+            os.utime(self.folder)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def content_type(path):
+        with open(path, 'rb') as f:
+            content_type, _, _ = image_info(f.read(32))
+        return content_type or 'application/octet-stream'
+
+    def thumbnail(self, digest, size=THUMBNAIL_SIZE):
+        """Path of a downscaled copy, created on first use; the original if Pillow is missing"""
+        source = self.path(digest)
+        if source is None or Image is None:
+            return source
+
+        path = self.folder / f'{digest}.thumb{size}'
+        if not path.exists():
+            with Image.open(source) as img:
+                img.thumbnail((size, size))
+                fmt = 'JPEG' if img.mode in ('RGB', 'L') else 'PNG'
+                tmp_path = path.with_name(f'.tmp-{path.name}')
+                img.save(tmp_path, fmt)
+            os.replace(tmp_path, path)
+        return path
+
+
+class MediaStore:
+    """Root of the per-document media folders"""
+
+    def __init__(self, root=MEDIA_FOLDER):
+        self.root = Path(root).resolve()
+
+    def document(self, document_id):
+        if not HEX_DIGEST.fullmatch(document_id):
+            raise ValueError(f"Invalid document id: {document_id}")
+        return DocumentMedia(self.root / document_id)
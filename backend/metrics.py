@@ -0,0 +1,112 @@
+"""Counters and histograms in shared memory, rendered in the Prometheus text format.
+
+Instruments are created at import, before gunicorn forks its workers (and
+before the batch pool forks its processes), so every process adds to the
+same numbers and any worker can answer a scrape. Label values are fixed
+when an instrument is created, since shared memory cannot grow.
+"""
+import multiprocessing
+from bisect import bisect_left
+
+# Seconds, from a fraction of a millisecond (one rule on a short document)
+# to minutes (a very large document)
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = tuple(1 << shift for shift in range(12, 30, 2))
+
+REGISTRY = []
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class _Instrument:
+    kind = None
+
+    def __init__(self, name, help, label=None, values=(), width=1):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = tuple(values) if label else (None,)
+        self._offsets = {value: i * width for i, value in enumerate(self.values)}
+        self._width = width
+        self._data = multiprocessing.Array('d', len(self.values) * width)
+        REGISTRY.append(self)
+
+    def _offset(self, value):
+        """Start of the series for a label value; None for values not declared"""
+        return self._offsets.get(value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._data.get_lock():
+            data = self._data[:]
+        for value, offset in self._offsets.items():
+            pairs = ((self.label, value),) if self.label else ()
+            lines.extend(self._render_series(pairs, data[offset:offset + self._width]))
+        return lines
+
+
+class Counter(_Instrument):
+    kind = 'counter'
+
+    def inc(self, amount=1, value=None):
+        offset = self._offset(value)
+        if offset is None:
+            return
+        with self._data.get_lock():
+            self._data[offset] += amount
+
+    def _render_series(self, pairs, series):
+        yield f'{self.name}{_labels(pairs)} {_format(series[0])}'
+
+
+class Histogram(_Instrument):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS, label=None, values=()):
+        self.buckets = tuple(buckets)
+        # Per label value: one count per bucket, then +Inf, sum and count
+        super().__init__(name, help, label, values, width=len(self.buckets) + 3)
+
+    def observe(self, amount, value=None):
+        offset = self._offset(value)
+        if offset is None:
+            return
+        bucket = bisect_left(self.buckets, amount)
+        with self._data.get_lock():
+            self._data[offset + bucket] += 1
+            self._data[offset + len(self.buckets) + 1] += amount
+            self._data[offset + len(self.buckets) + 2] += 1
+
+    def totals(self, value=None):
+        """(count, sum) observed so far for a label value"""
+        offset = self._offset(value)
+        width = len(self.buckets)
+        with self._data.get_lock():
+            return self._data[offset + width + 2], self._data[offset + width + 1]
+
+    def _render_series(self, pairs, series):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), series):
+            cumulative += count
+            le = bound if bound == '+Inf' else _format(bound)
+            yield f'{self.name}_bucket{_labels(pairs + (("le", le),))} {_format(cumulative)}'
+        yield f'{self.name}_sum{_labels(pairs)} {_format(series[-2])}'
+        yield f'{self.name}_count{_labels(pairs)} {_format(series[-1])}'
+
+
+def render(extra=()):
+    """Every registered instrument, plus ``extra`` (name, type, help, value) gauges, as exposition text"""
+    lines = []
+    for instrument in REGISTRY:
+        lines.extend(instrument.render())
+    for name, kind, help, value in extra:
+        lines.extend((f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {_format(value)}'))
+    return '\n'.join(lines) + '\n'
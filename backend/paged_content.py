@@ -0,0 +1,79 @@
+"""Rendered paragraphs kept per document for ``GET /documents/<id>/content``.
+
+A document's rendered HTML is written once per ruleset into its media
+folder, one paragraph per line, with an index of the byte offset where
+each line starts. Any range of paragraphs is then served with one seek
+and one read, however long the document is. Living in the media folder,
+the pages belong to the same storage janitor unit as the document's
+images and cached results, and go when they go.
+"""
+import os
+import tempfile
+from array import array
+from pathlib import Path
+
+# Most paragraphs one request may ask for
+CONTENT_PAGE_LIMIT = int(os.environ.get('CONTENT_PAGE_LIMIT', 200))
+OFFSET_SIZE = array('Q').itemsize
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class PagedContent:
+    """The rendered paragraphs of one document under one ruleset"""
+
+    def __init__(self, folder, ruleset):
+        folder = Path(folder)
+        self.path = folder / f'content-{ruleset}.html'
+        self.index_path = folder / f'content-{ruleset}.idx'
+
+    def write(self, content):
+        """Store ``content``, the rendered paragraphs joined by newlines
+
+        The paragraphs go first and the index last, so pages are only
+        served once both are complete.
+        """
+        data = content.encode('utf-8')
+        offsets = array('Q', [0])
+        if data:
+            position = data.find(b'\n')
+            while position != -1:
+                offsets.append(position + 1)
+                position = data.find(b'\n', position + 1)
+            # The end of the last paragraph, as if it were followed by a newline
+            offsets.append(len(data) + 1)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.path, data)
+        _write_atomic(self.index_path, offsets.tobytes())
+
+    def count(self):
+        """Number of stored paragraphs, or None if the document has none stored"""
+        try:
+            size = self.index_path.stat().st_size
+        except FileNotFoundError:
+            return None
+        return size // OFFSET_SIZE - 1
+
+    def read(self, first, last):
+        """The HTML of paragraphs ``first`` to ``last`` (1-based, inclusive, within count()) as a list"""
+        if last < first:
+            return []
+        offsets = array('Q')
+        with open(self.index_path, 'rb') as f:
+            f.seek((first - 1) * OFFSET_SIZE)
+            offsets.frombytes(f.read((last - first + 2) * OFFSET_SIZE))
+        with open(self.path, 'rb') as f:
+            f.seek(offsets[0])
+            # The last offset is one past the final newline, or past the end of the file
+            data = f.read(offsets[-1] - offsets[0] - 1)
+        return data.decode('utf-8').split('\n')
+
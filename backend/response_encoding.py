@@ -0,0 +1,71 @@
+"""Content negotiation for large JSON-shaped responses.
+
+The body is JSON, or MessagePack when the client's ``Accept`` prefers it,
+and is compressed with brotli or gzip per ``Accept-Encoding`` once it is
+big enough for that to pay off. MessagePack and brotli are optional: without
+their packages the server offers only JSON and gzip.
+"""
+import gzip
+import json
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional; JSON is always available
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# Brotli's quality 11 is far too slow for per-request use
+BROTLI_QUALITY = 5
+
+
+def media_types():
+    """Body formats this server can produce, most preferred first"""
+    return [JSON, MSGPACK, 'application/x-msgpack'] if msgpack is not None else [JSON]
+
+
+def content_codings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def serialize(payload, mimetype):
+    if mimetype == JSON:
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def negotiated_response(payload, status=200):
+    """A response for ``payload`` in the format and content coding the request accepts
+
+    Falls back to plain JSON when the client accepts nothing on offer.
+    """
+    mimetype = request.accept_mimetypes.best_match(media_types(), default=JSON)
+    if mimetype != JSON:
+        mimetype = MSGPACK
+    body = serialize(payload, mimetype)
+
+    response = Response(status=status, mimetype=mimetype)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    if len(body) >= COMPRESS_MIN_BYTES:
+        coding = request.accept_encodings.best_match(content_codings())
+        if coding is not None:
+            body = compress(body, coding)
+            response.content_encoding = coding
+    response.set_data(body)
+    return response
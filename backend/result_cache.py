@@ -0,0 +1,181 @@
+"""Two-tier cache of /validate results keyed by upload hash and ruleset version.
+
+Results are kept as serialized JSON: a bounded in-memory LRU in front of an
+on-disk store shared by every worker process. Both tiers are capped in
+bytes and evict least recently used entries first.
+
+The counters and the disk tier's size live in shared memory created before
+gunicorn forks its workers, so they cover the whole server. Each worker
+has a memory tier of its own, and reports only that.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_FOLDER = 'cache'
+COUNTERS = ('hits', 'memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions')
+
+
+class ResultCache:
+    """Serialized results in an LRU memory tier backed by a capped disk tier"""
+
+    def __init__(self, folder=CACHE_FOLDER, max_memory_bytes=64 << 20, max_disk_bytes=1 << 30):
+        self.folder = Path(folder)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # The memory tier is this process's; the lock guarding it never spans processes
+        self._lock = threading.Lock()
+        # Shared with the forked workers and only held to read or update them
+        self._shared = multiprocessing.Lock()
+        self._counters = multiprocessing.Array('q', len(COUNTERS), lock=False)
+        self._disk_bytes = multiprocessing.Value('q', self._scan_disk_bytes(), lock=False)
+
+    def _count(self, name, n=1):
+        with self._shared:
+            self._counters[COUNTERS.index(name)] += n
+
+    def _add_disk_bytes(self, n):
+        """Add ``n`` to the disk tier's size and return the new size"""
+        with self._shared:
+            self._disk_bytes.value += n
+            return self._disk_bytes.value
+
+    @staticmethod
+    def key(document_id, ruleset, part=None):
+        """Key of a result, or of a named ``part`` stored alongside it"""
+        key = f"{document_id}-{ruleset}"
+        return f"{key}-{part}" if part else key
+
+    def _path(self, key):
+        return self.folder / f"{key}.json"
+
+    def get(self, key):
+        """Return a fresh copy of the cached result, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+        if data is not None:
+            self._count("hits")
+            self._count("memory_hits")
+            return json.loads(data)
+
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mark as recently used for disk eviction
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        self._count("disk_hits")
+        with self._lock:
+            self._remember(key, data)
+        return json.loads(data)
+
+    def put(self, key, result):
+        data = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._remember(key, data)
+        self._store(key, data)
+
+    def discard(self, key):
+        """Drop an entry from both tiers"""
+        with self._lock:
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+        try:
+            size = self._path(key).stat().st_size
+            self._path(key).unlink()
+        except FileNotFoundError:
+            return
+        self._add_disk_bytes(-size)
+
+    def _remember(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._count("memory_evictions")
+
+    def _store(self, key, data):
+        if len(data) > self.max_disk_bytes:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # An entry being overwritten no longer counts towards the disk tier
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if self._add_disk_bytes(len(data) - replaced) > self.max_disk_bytes:
+            with self._lock:
+                self._evict_disk()
+
+    def _scan_disk_bytes(self):
+        return sum(entry.stat().st_size for entry in self.folder.glob('*.json'))
+
+    def _evict_disk(self):
+        # Trim to 90% of the cap so eviction scans stay rare
+        entries = []
+        for entry in self.folder.glob('*.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        for _, size, entry in entries:
+            if total <= target:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count("disk_evictions")
+        with self._shared:
+            self._disk_bytes.value = total
+
+    def stats(self):
+        """Server-wide counters and disk usage, with this worker's memory tier"""
+        with self._shared:
+            counters = dict(zip(COUNTERS, self._counters))
+            disk_bytes = self._disk_bytes.value
+        with self._lock:
+            memory_entries, memory_bytes = len(self._memory), self._memory_bytes
+        return dict(
+            counters,
+            worker_pid=os.getpid(),
+            memory_entries=memory_entries,
+            memory_bytes=memory_bytes,
+            max_memory_bytes=self.max_memory_bytes,
+            disk_bytes=disk_bytes,
+            max_disk_bytes=self.max_disk_bytes,
+        )
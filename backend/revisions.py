@@ -0,0 +1,127 @@
+"""Incremental re-validation of a revised document.
+
+Every validation records a fingerprint of each paragraph's content and
+formatting. When an upload is marked as a revision of an earlier document,
+paragraphs whose fingerprint matches an old paragraph take its word errors
+and rendered HTML instead of being checked and rendered again. Paragraphs
+with figure references are still rendered, since whether a reference is
+valid depends on the rest of the document.
+"""
+import hashlib
+import re
+from collections import deque, namedtuple
+from difflib import SequenceMatcher
+
+# Parts outside document.xml that change how every paragraph is judged
+CONTEXT_PARTS = ('word/styles.xml', 'word/theme/theme1.xml')
+
+# Per paragraph in a record: [digest, unjustified, has references, font error words, size error words]
+DIGEST, UNJUSTIFIED, HAS_REFERENCES, FONT_WORDS, SIZE_WORDS = range(5)
+
+# An error span's markup in rendered HTML (see Validation.ContentRenderRule)
+WORD_SPAN = re.compile(r'id="word_\d+_(\d+)" class="doc-word ([^"]*)" data-code="(\d+)"')
+
+Reused = namedtuple('Reused', 'paragraph html has_references word_errors unjustified font_words size_words')
+
+
+def paragraph_digest(element):
+    """Fingerprint of a paragraph's text, properties and structure"""
+    parts = []
+    for elem in element.iter():
+        parts.append(elem.tag)
+        if elem.attrib:
+            parts.append(repr(elem.attrib))
+        if elem.text:
+            parts.append(elem.text)
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def context_digest(docx, ruleset):
+    """Fingerprint of what paragraphs are judged against besides their own XML"""
+    digest = hashlib.blake2b(ruleset.encode('utf-8'), digest_size=12)
+    names = set(docx.namelist())
+    for part in CONTEXT_PARTS:
+        digest.update(b'\0')
+        if part in names:
+            with docx.open(part) as f:
+                while chunk := f.read(1 << 16):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Revision:
+    """Results of an earlier version of a document, offered paragraph by paragraph"""
+
+    def __init__(self, document_id, record, result):
+        self.document_id = document_id
+        self.context = record["context"]
+        self.paragraphs = record["paragraphs"]
+        self.html = result["content"].split("\n")
+        word_errors = result["word_errors"]
+        self.messages = word_errors["messages"]
+        self.codes = word_errors["codes"]
+        # old code -> code in the new document's table
+        self._new_codes = {}
+        # Image spans (zero-length) are not reused; they are recreated for every drawing
+        self.word_errors = {}
+        for paragraph, start, end, code in word_errors["spans"]:
+            if end > start:
+                self.word_errors.setdefault(paragraph, []).append((start, end, code))
+
+        # digest -> old paragraph numbers not yet reused
+        self.available = {}
+        for number, paragraph in enumerate(self.paragraphs, 1):
+            self.available.setdefault(paragraph[DIGEST], deque()).append(number)
+        self.reused = 0
+
+    def reuse(self, digest):
+        """Results of an unchanged old paragraph with this digest, each one reused at most once"""
+        numbers = self.available.get(digest)
+        if not numbers:
+            return None
+        number = numbers.popleft()
+        paragraph = self.paragraphs[number - 1]
+        self.reused += 1
+        return Reused(
+            number,
+            self.html[number - 1],
+            bool(paragraph[HAS_REFERENCES]),
+            self.word_errors.pop(number, ()),
+            paragraph[UNJUSTIFIED],
+            paragraph[FONT_WORDS],
+            paragraph[SIZE_WORDS],
+        )
+
+    def new_code(self, code, word_errors):
+        """The code in ``word_errors`` (a Validation.WordErrors) for one of the old codes"""
+        new = self._new_codes.get(code)
+        if new is None:
+            new = self._new_codes[code] = word_errors.code([self.messages[i] for i in self.codes[code]])
+        return new
+
+    def renumber(self, html, paragraph, word_errors):
+        """Reused paragraph HTML with its span ids and codes as they are in the new document"""
+        if 'data-code="' not in html:
+            return html
+
+        def span(match):
+            code = self.new_code(int(match.group(3)), word_errors)
+            return (f'id="word_{paragraph}_{match.group(1)}" class="doc-word {word_errors.classes[code]}" '
+                    f'data-code="{code}"')
+
+        return WORD_SPAN.sub(span, html)
+
+    def diff(self, paragraphs):
+        """Changed paragraph ranges between this version and ``paragraphs``, as in unified diffs"""
+        matcher = SequenceMatcher(None, [p[DIGEST] for p in self.paragraphs], [p[DIGEST] for p in paragraphs])
+        return [
+            {
+                "op": op,
+                "old_start": old_start + 1,
+                "old_count": old_end - old_start,
+                "new_start": new_start + 1,
+                "new_count": new_end - new_start,
+            }
+            for op, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+            if op != 'equal'
+        ]
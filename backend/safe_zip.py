@@ -0,0 +1,71 @@
+"""ZIP archives opened with limits on how much they may decompress to.
+
+Every member's size is declared in the central directory, and ``zipfile``
+never returns more than the declared size from a member, so checking the
+declarations when the archive is opened bounds the disk and memory a
+request can use before anything is decompressed. Members are still read
+as streams; nothing is extracted.
+"""
+import os
+import re
+import zipfile
+
+MAX_ARCHIVE_MEMBERS = int(os.environ.get('MAX_ARCHIVE_MEMBERS', 20000))
+# Sum of every member's uncompressed size
+MAX_UNCOMPRESSED_BYTES = int(os.environ.get('MAX_UNCOMPRESSED_BYTES', 1 << 30))
+MAX_MEMBER_BYTES = int(os.environ.get('MAX_MEMBER_BYTES', 256 << 20))
+# XML parts other than the streamed body, headers, footers and notes are parsed into a tree whole
+MAX_TREE_XML_BYTES = int(os.environ.get('MAX_TREE_XML_BYTES', 16 << 20))
+# Headers and footers are numbered (word/header1.xml); see Validation.TEXT_PART_PATTERN
+STREAMED_XML_PARTS = re.compile(r'word/(document|(header|footer|footnotes|endnotes)\d*)\.xml')
+# Ordinary XML compresses 5-30x; bombs compress hundreds or thousands of times
+MAX_COMPRESSION_RATIO = float(os.environ.get('MAX_COMPRESSION_RATIO', 200))
+# Small members are exempt from the ratio check: a short run of spaces compresses very well
+RATIO_CHECK_MIN_BYTES = 1 << 20
+
+
+class ArchiveTooLarge(ValueError):
+    """The archive decompresses to more than the limits allow"""
+
+
+def _megabytes(size):
+    return f"{size / (1 << 20):.0f} MB"
+
+
+def check_archive(infos, max_total=MAX_UNCOMPRESSED_BYTES, max_member=MAX_MEMBER_BYTES):
+    """Raise ArchiveTooLarge if the declared members break a limit"""
+    if len(infos) > MAX_ARCHIVE_MEMBERS:
+        raise ArchiveTooLarge(f"Archive has more than {MAX_ARCHIVE_MEMBERS} parts")
+
+    total = 0
+    for info in infos:
+        size = info.file_size
+        name = info.filename
+        limit = max_member
+        if name.endswith(('.xml', '.rels')) and not STREAMED_XML_PARTS.fullmatch(name):
+            limit = min(limit, MAX_TREE_XML_BYTES)
+        if size > limit:
+            raise ArchiveTooLarge(f"{name} expands to more than {_megabytes(limit)}")
+        if size > RATIO_CHECK_MIN_BYTES and size > info.compress_size * MAX_COMPRESSION_RATIO:
+            raise ArchiveTooLarge(f"{name} is compressed more than {MAX_COMPRESSION_RATIO:g} to 1")
+        total += size
+        if total > max_total:
+            raise ArchiveTooLarge(f"Archive expands to more than {_megabytes(max_total)}")
+
+    # Members whose data overlaps let a small archive declare the same bytes many times
+    entries = sorted(infos, key=lambda info: info.header_offset)
+    for info, following in zip(entries, entries[1:]):
+        if info.header_offset + info.compress_size > following.header_offset:
+            raise ArchiveTooLarge(f"{info.filename} overlaps {following.filename}")
+
+
+class BoundedZipFile(zipfile.ZipFile):
+    """A read-only ZipFile that refuses archives breaking the decompression limits"""
+
+    def __init__(self, file, max_total=MAX_UNCOMPRESSED_BYTES, max_member=MAX_MEMBER_BYTES):
+        super().__init__(file, 'r')
+        try:
+            check_archive(self.infolist(), max_total, max_member)
+        except BaseException:
+            self.close()
+            raise
@@ -5,11 +5,16 @@ from flask_cors import CORS
 import json
 import re
 from transformers import pipeline
-import xml.etree.ElementTree as ET
 import base64
 import io
 import zipfile
 
+# The streaming validation engine lives in the backend package root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import NS, Rule, ValidationEngine
+from style_profiles import get_profile
+from xml_backend import Path
+
 app = Flask(__name__)
 CORS(app)
 
@@ -17,204 +22,235 @@ CORS(app)
 os.makedirs('uploads', exist_ok=True)
 os.makedirs('extracted', exist_ok=True)
 
-def extract_docx_content(docx_file_path):
-    """Extract text content from a DOCX file using pure Python libraries"""
-    try:
-        # Open the DOCX file as a zip
-        with zipfile.ZipFile(docx_file_path, 'r') as zip_ref:
-            # Extract document.xml which contains the main content
-            if 'word/document.xml' in zip_ref.namelist():
-                content_xml = zip_ref.read('word/document.xml')
-                
-                # Parse XML
-                root = ET.fromstring(content_xml)
-                
-                # Extract text from paragraphs (simplified)
-                # In a real implementation, this would handle more complex document structures
-                ns = {
-                    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-                }
-                
-                paragraphs = []
-                for para in root.findall('.//w:p', ns):
-                    texts = []
-                    for text_elem in para.findall('.//w:t', ns):
-                        if text_elem.text:
-                            texts.append(text_elem.text)
-                    if texts:
-                        paragraphs.append(''.join(texts))
-                
-                return '\n'.join(paragraphs)
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_DRAWING = f'{{{W_NS}}}drawing'
+
+# Searches the rules make, compiled once (see xml_backend)
+FIRST_TEXT = Path('.//w:t', NS)
+PAGE_SIZE = Path('.//w:pgSz', NS)
+PAGE_MARGINS = Path('.//w:pgMar', NS)
+RUN_PROPERTIES = Path('.//w:rPr', NS)
+FONT_SIZE = Path('.//w:sz', NS)
+FONTS = Path('.//w:rFonts', NS)
+
+
+class MainValidationContext:
+    """Result containers filled in by the rules below"""
+
+    def __init__(self, profile=None):
+        self.profile = profile or get_profile()
+        self.errors = {
+            'summary': [],
+            'formatting': [],
+            'fonts': [],
+            'images': []
+        }
+        self.word_errors = {}
+        # (line, run index) -> first word_errors key for that run
+        self.run_errors = {}
+        self.image_refs = []
+        self.images = []
+        self.html_content = ""
+
+
+class SectionRule(Rule):
+    """Check page size, orientation and margins of every section"""
+
+    name = 'sections'
+
+    def start(self, ctx):
+        self.size_errors = []
+        self.margin_errors = []
+
+    def section(self, ctx, sect):
+        page = ctx.profile.page
+        margin = ctx.profile.margins
+        # Check for page size and orientation
+        page_size = PAGE_SIZE.first(sect)
+        if page_size is not None:
+            w = page_size.get(f'{{{W_NS}}}w')
+            h = page_size.get(f'{{{W_NS}}}h')
+            if w and h:
+                if int(w) != int(page['w']) or int(h) != int(page['h']):
+                    self.size_errors.append((w, h))
+
+        # Check margins
+        margins = PAGE_MARGINS.first(sect)
+        if margins is not None:
+            left = margins.get(f'{{{W_NS}}}left')
+            right = margins.get(f'{{{W_NS}}}right')
+            if left and right:
+                if int(left) != int(margin['left']) or int(right) != int(margin['right']):
+                    self.margin_errors.append((left, right))
+
+    def finish(self, ctx):
+        errors = ctx.errors
+        profile = ctx.profile
+        for w, h in self.size_errors:
+            errors['formatting'].append({
+                'type': 'error',
+                'message': f'Page size or orientation NOT set to {profile.page_name} (w={w}, h={h}).'
+            })
+            errors['summary'].append({
+                'type': 'error',
+                'message': f'Page size or orientation NOT set to {profile.page_name}.'
+            })
+        for left, right in self.margin_errors:
+            errors['formatting'].append({
+                'type': 'error',
+                'message': f'Margins NOT set to {profile.margin_name} correctly (left={left}, right={right}).'
+            })
+            errors['summary'].append({
+                'type': 'error',
+                'message': f'Margins NOT set to {profile.margin_name} correctly.'
+            })
+
+
+class RunFontRule(Rule):
+    """Check font sizes and types run by run"""
+
+    name = 'fonts'
+
+    def start(self, ctx):
+        self.word_id = 0
+
+    def paragraph(self, ctx, para):
+        profile = ctx.profile
+        line_num = para.index
+        for run_idx, (run, _) in enumerate(para.runs):
+            rPr = RUN_PROPERTIES.first(run)
+            if rPr is None:
+                continue
+            # Check font size
+            sz = FONT_SIZE.first(rPr)
+            if sz is not None:
+                size_val = sz.get(f'{{{W_NS}}}val')
+                if size_val and size_val not in profile.allowed_sizes:
+                    text_elem = FIRST_TEXT.first(run)
+                    if text_elem is not None and text_elem.text and text_elem.text.strip():
+                        self.word_id += 1
+                        word_key = f"word_{self.word_id}"
+                        ctx.run_errors.setdefault((line_num, run_idx), word_key)
+                        ctx.word_errors[word_key] = {
+                            'text': text_elem.text,
+                            'line': line_num,
+                            'errors': [{
+                                'type': 'warning',
+                                'message': f'Font size sz={size_val} (should be {profile.size_names})'
+                            }]
+                        }
+                        ctx.errors['fonts'].append({
+                            'type': 'warning',
+                            'message': f'Line {line_num}: font size sz={size_val}, szCs={size_val} (should be {profile.size_names})'
+                        })
+
+            # Check font type
+            font = FONTS.first(rPr)
+            if font is not None:
+                ascii_font = font.get(f'{{{W_NS}}}ascii')
+                if ascii_font and ascii_font not in profile.allowed_fonts:
+                    text_elem = FIRST_TEXT.first(run)
+                    if text_elem is not None and text_elem.text and text_elem.text.strip():
+                        self.word_id += 1
+                        word_key = f"word_{self.word_id}"
+                        ctx.run_errors.setdefault((line_num, run_idx), word_key)
+                        ctx.word_errors[word_key] = {
+                            'text': text_elem.text,
+                            'line': line_num,
+                            'errors': [{
+                                'type': 'error',
+                                'message': f'Font type "{ascii_font}" (should be {profile.font_names})'
+                            }]
+                        }
+                        ctx.errors['fonts'].append({
+                            'type': 'error',
+                            'message': f'Line {line_num}: font type "{ascii_font}" (should be {profile.font_names})'
+                        })
+
+
+class ImageRule(Rule):
+    """Collect figure/table references and drawings, then match them up"""
+
+    name = 'images'
+
+    # Find all image references in text (e.g., "Figure 1", "Table 2")
+    ref_pattern = re.compile(r'(Figure|Table|Fig\.)\s+(\d+)', re.IGNORECASE)
+
+    def paragraph(self, ctx, para):
+        for match in self.ref_pattern.finditer(para.text):
+            ref_type = match.group(1)
+            ref_num = match.group(2)
+            ctx.image_refs.append({
+                'id': f"ref_{ref_type}_{ref_num}",
+                'type': ref_type,
+                'number': ref_num,
+                'valid': False  # Will be set to True if matching image is found
+            })
+
+        # Nested paragraphs are already covered by their outer paragraph
+        if not para.nested:
+            for _ in para.element.iter(W_DRAWING):
+                ctx.images.append({
+                    'id': f"img_{len(ctx.images) + 1}",
+                    'type': 'image'
+                })
+
+    def finish(self, ctx):
+        # Validate references against images
+        for ref in ctx.image_refs:
+            # Simple validation - just check if we have enough images
+            if int(ref['number']) <= len(ctx.images):
+                ref['valid'] = True
             else:
-                return "Could not find document content."
-    except Exception as e:
-        print(f"Error extracting DOCX content: {str(e)}")
-        return f"Error extracting document content: {str(e)}"
+                ctx.errors['images'].append({
+                    'type': 'warning',
+                    'message': f"Reference to {ref['type']} {ref['number']} found, but image may be missing"
+                })
 
-def validate_docx(docx_file_path):
-    """Validate DOCX file and return errors"""
-    try:
-        # Extract content for display
-        content = extract_docx_content(docx_file_path)
+
+class HtmlRule(Rule):
+    """Convert content to HTML for display"""
+
+    name = 'html'
+
+    def start(self, ctx):
+        self.html_parts = []
+
+    def paragraph(self, ctx, para):
+        current_line = para.index
+        para_html = "<p>"
+        for run_idx, (run, _) in enumerate(para.runs):
+            text_elem = FIRST_TEXT.first(run)
+            if text_elem is not None and text_elem.text:
+                # Check if this run has errors
+                error_id = ctx.run_errors.get((current_line, run_idx))
+                
+                if error_id:
+                    para_html += f'<span id="{error_id}" class="doc-word">{text_elem.text}</span>'
+                else:
+                    para_html += text_elem.text
         
+        para_html += "</p>"
+        self.html_parts.append(para_html)
+
+    def finish(self, ctx):
+        ctx.html_content = "".join(self.html_parts)
+
+
+def validate_docx(docx_file_path, profile=None):
+    """Validate DOCX file against a style profile (the house style by default) and return errors"""
+    try:
         # Open the DOCX file as a zip
         with zipfile.ZipFile(docx_file_path, 'r') as zip_ref:
             # Extract document.xml which contains the main content
             if 'word/document.xml' in zip_ref.namelist():
-                content_xml = zip_ref.read('word/document.xml')
-                
-                # Parse XML
-                root = ET.fromstring(content_xml)
-                
-                # Namespace for Word XML
-                ns = {
-                    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-                }
-                
-                # Validate document structure and formatting
-                errors = {
-                    'summary': [],
-                    'formatting': [],
-                    'fonts': [],
-                    'images': []
-                }
-                
-                # Check for page size and orientation
-                section_props = root.findall('.//w:sectPr', ns)
-                if section_props:
-                    for sect in section_props:
-                        page_size = sect.find('.//w:pgSz', ns)
-                        if page_size is not None:
-                            w = page_size.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}w')
-                            h = page_size.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}h')
-                            if w and h:
-                                if int(w) != 12240 or int(h) != 15840:  # A4 portrait
-                                    errors['formatting'].append({
-                                        'type': 'error',
-                                        'message': f'Page size or orientation NOT set to A4 portrait (w={w}, h={h}).'
-                                    })
-                                    errors['summary'].append({
-                                        'type': 'error',
-                                        'message': 'Page size or orientation NOT set to A4 portrait.'
-                                    })
-                
-                # Check margins
-                section_props = root.findall('.//w:sectPr', ns)
-                if section_props:
-                    for sect in section_props:
-                        margins = sect.find('.//w:pgMar', ns)
-                        if margins is not None:
-                            left = margins.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}left')
-                            right = margins.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}right')
-                            if left and right:
-                                if int(left) != 1440 or int(right) != 1440:  # 1 inch margins
-                                    errors['formatting'].append({
-                                        'type': 'error',
-                                        'message': f'Margins NOT set to 2.5cm correctly (left={left}, right={right}).'
-                                    })
-                                    errors['summary'].append({
-                                        'type': 'error',
-                                        'message': 'Margins NOT set to 2.5cm correctly.'
-                                    })
-                
-                # Check font sizes and types
-                word_errors = {}
-                line_num = 0
-                word_id = 0
-                
-                for para in root.findall('.//w:p', ns):
-                    line_num += 1
-                    for run in para.findall('.//w:r', ns):
-                        rPr = run.find('.//w:rPr', ns)
-                        if rPr is not None:
-                            # Check font size
-                            sz = rPr.find('.//w:sz', ns)
-                            if sz is not None:
-                                size_val = sz.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val')
-                                if size_val and int(size_val) != 24:  # 12pt = 24 half-points
-                                    text_elem = run.find('.//w:t', ns)
-                                    if text_elem is not None and text_elem.text and text_elem.text.strip():
-                                        word_id += 1
-                                        word_key = f"word_{word_id}"
-                                        word_errors[word_key] = {
-                                            'text': text_elem.text,
-                                            'line': line_num,
-                                            'errors': [{
-                                                'type': 'warning',
-                                                'message': f'Font size sz={size_val} (should be 24 for 12pt)'
-                                            }]
-                                        }
-                                        errors['fonts'].append({
-                                            'type': 'warning',
-                                            'message': f'Line {line_num}: font size sz={size_val}, szCs={size_val} (should be 24 for 12pt)'
-                                        })
-                            
-                            # Check font type
-                            font = rPr.find('.//w:rFonts', ns)
-                            if font is not None:
-                                ascii_font = font.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}ascii')
-                                if ascii_font and ascii_font != 'Times New Roman':
-                                    text_elem = run.find('.//w:t', ns)
-                                    if text_elem is not None and text_elem.text and text_elem.text.strip():
-                                        word_id += 1
-                                        word_key = f"word_{word_id}"
-                                        word_errors[word_key] = {
-                                            'text': text_elem.text,
-                                            'line': line_num,
-                                            'errors': [{
-                                                'type': 'error',
-                                                'message': f'Font type "{ascii_font}" (should be Times New Roman)'
-                                            }]
-                                        }
-                                        errors['fonts'].append({
-                                            'type': 'error',
-                                            'message': f'Line {line_num}: font type "{ascii_font}" (should be Times New Roman)'
-                                        })
-                
-                # Check for images and references
-                image_refs = []
-                images = []
-                
-                # Find all image references in text (e.g., "Figure 1", "Table 2")
-                ref_pattern = re.compile(r'(Figure|Table|Fig\.)\s+(\d+)', re.IGNORECASE)
-                
-                # Extract text to find references
-                all_text = ""
-                for para in root.findall('.//w:p', ns):
-                    para_text = ""
-                    for text_elem in para.findall('.//w:t', ns):
-                        if text_elem.text:
-                            para_text += text_elem.text
-                    all_text += para_text + "\n"
-                
-                # Find all references
-                for match in ref_pattern.finditer(all_text):
-                    ref_type = match.group(1)
-                    ref_num = match.group(2)
-                    image_refs.append({
-                        'id': f"ref_{ref_type}_{ref_num}",
-                        'type': ref_type,
-                        'number': ref_num,
-                        'valid': False  # Will be set to True if matching image is found
-                    })
-                
-                # Find all images in document
-                for drawing in root.findall('.//w:drawing', ns):
-                    images.append({
-                        'id': f"img_{len(images) + 1}",
-                        'type': 'image'
-                    })
-                
-                # Validate references against images
-                for ref in image_refs:
-                    # Simple validation - just check if we have enough images
-                    if int(ref['number']) <= len(images):
-                        ref['valid'] = True
-                    else:
-                        errors['images'].append({
-                            'type': 'warning',
-                            'message': f"Reference to {ref['type']} {ref['number']} found, but image may be missing"
-                        })
+                # Stream document.xml once through every rule
+                ctx = MainValidationContext(profile)
+                engine = ValidationEngine([SectionRule(), RunFontRule(), ImageRule(), HtmlRule()])
+                with zip_ref.open('word/document.xml') as content_xml:
+                    engine.run(content_xml, ctx)
+
+                errors = ctx.errors
                 
                 # Add summary of errors
                 if errors['fonts'] or errors['formatting']:
@@ -224,40 +260,12 @@ def validate_docx(docx_file_path):
                         'message': f"Found {error_count} formatting issues in the document."
                     })
                 
-                # Convert content to HTML for display
-                html_content = ""
-                current_line = 1
-                
-                for para in root.findall('.//w:p', ns):
-                    para_html = "<p>"
-                    for run in para.findall('.//w:r', ns):
-                        text_elem = run.find('.//w:t', ns)
-                        if text_elem is not None and text_elem.text:
-                            # Check if this word has errors
-                            has_error = False
-                            error_id = None
-                            
-                            for word_id, word_info in word_errors.items():
-                                if word_info['line'] == current_line and text_elem.text.strip() in word_info['text']:
-                                    has_error = True
-                                    error_id = word_id
-                                    break
-                            
-                            if has_error:
-                                para_html += f'<span id="{error_id}" class="doc-word">{text_elem.text}</span>'
-                            else:
-                                para_html += text_elem.text
-                    
-                    para_html += "</p>"
-                    html_content += para_html
-                    current_line += 1
-                
                 return {
-                    'content': html_content,
+                    'content': ctx.html_content,
                     'errors': errors,
-                    'word_errors': word_errors,
-                    'images': images,
-                    'image_references': image_refs
+                    'word_errors': ctx.word_errors,
+                    'images': ctx.images,
+                    'image_references': ctx.image_refs
                 }
             else:
                 return {
@@ -0,0 +1,271 @@
+"""Disk housekeeping: per-request workspaces and a janitor under a global quota.
+
+Everything the backend writes lives in four folders: per-document media,
+the result cache, job state and per-request workspaces. The janitor
+periodically groups their files into units and removes those past their
+TTL, then least recently used ones until the total is back under the
+quota. A document's media and its cached results form one unit, so a
+cached result is never served after its images have gone. Queued and
+running jobs, and workspaces still within their TTL, are never evicted.
+
+Under gunicorn the janitor is created in the master but started in each
+worker after the fork (see gunicorn.conf.py). The usage, the counters and
+the time of the next periodic sweep are shared between the workers, so
+one of them sweeps per interval and all of them see its figures.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+WORKSPACE_FOLDER = 'workspaces'
+DISK_QUOTA_BYTES = int(os.environ.get('DISK_QUOTA_BYTES', 4 << 30))
+JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 300))
+# Seconds since last use after which a unit is removed regardless of the quota
+DOCUMENT_TTL = float(os.environ.get('DOCUMENT_TTL', 7 * 24 * 60 * 60))
+JOB_TTL = float(os.environ.get('JOB_TTL', 24 * 60 * 60))
+# A workspace outlives its request only if the worker died; this is generous
+WORKSPACE_TTL = float(os.environ.get('WORKSPACE_TTL', 6 * 60 * 60))
+
+DOCUMENT_ID_LENGTH = 64
+
+# paths: files or folders to remove; cache_keys: ResultCache entries to discard;
+# expires: may be removed after its TTL; evictable: may also be removed to meet the quota
+Unit = namedtuple('Unit', 'kind last_used size paths cache_keys expires evictable')
+COUNTERS = ('sweeps', 'expired', 'evicted', 'freed_bytes')
+
+
+def _tree_stat(path):
+    """(total bytes, latest mtime) of a file or a folder tree"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return 0, 0.0
+    if not path.is_dir():
+        return stat.st_size, stat.st_mtime
+    size, mtime = 0, stat.st_mtime
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+def _remove(path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class Workspaces:
+    """Private scratch folders, one per request"""
+
+    def __init__(self, root=WORKSPACE_FOLDER):
+        self.root = Path(root).resolve()
+
+    def create(self, kind):
+        """A new empty folder named after ``kind`` and a fresh request id"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{kind}-{uuid.uuid4().hex}"
+        path.mkdir()
+        return path
+
+    def remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class Janitor:
+    """Keeps media, cache, job and workspace folders within their TTLs and the disk quota"""
+
+    def __init__(self, media_store, result_cache, job_store, workspaces,
+                 quota_bytes=DISK_QUOTA_BYTES, interval=JANITOR_INTERVAL):
+        self.media_store = media_store
+        self.result_cache = result_cache
+        self.job_store = job_store
+        self.workspaces = workspaces
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.ttls = {"document": DOCUMENT_TTL, "job": JOB_TTL, "workspace": WORKSPACE_TTL}
+        # Shared with the forked workers; the lock is only held to read or
+        # update them, never across a sweep, so a worker dying cannot wedge it
+        self._usage = multiprocessing.Value('q', -1, lock=False)
+        self._counters = multiprocessing.Array('q', len(COUNTERS), lock=False)
+        self._next_sweep = multiprocessing.Value('d', 0.0, lock=False)
+        self._shared = multiprocessing.Lock()
+        # One sweep at a time within a process
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Set to have the janitor thread sweep now rather than at its next interval
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def usage(self):
+        """Bytes in use at the last sweep by any process, or None before the first"""
+        usage = self._usage.value
+        return None if usage < 0 else usage
+
+    def start(self):
+        """Sweep in a daemon thread every ``interval`` seconds (never if it is 0)
+
+        Call it in the process that serves requests: a thread started before
+        a fork does not run in the children, and a lock it holds at the
+        time stays held in them.
+        """
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._wake.is_set() or self._claim_sweep():
+                    self._wake.clear()
+                    self.sweep()
+            except Exception:
+                import traceback
+                print(traceback.format_exc())
+            self._wake.wait(self.interval)
+
+    def _claim_sweep(self):
+        """Whether the periodic sweep is this process's to do, so one process sweeps per interval"""
+        with self._shared:
+            now = time.time()
+            if now < self._next_sweep.value:
+                return False
+            self._next_sweep.value = now + self.interval
+            return True
+
+    def has_room(self):
+        """Whether new files may be written, going by the last sweep's count
+
+        Requests never wait for a sweep: when the count is missing or over
+        the quota, the janitor thread is woken to sweep and the request is
+        answered from the count as it is. Only a process without a janitor
+        thread sweeps inline.
+        """
+        usage = self.usage
+        if usage is None or usage >= self.quota_bytes:
+            if self._thread is None:
+                self.sweep()
+                usage = self.usage
+            else:
+                self._wake.set()
+        return usage is None or usage < self.quota_bytes
+
+    def _count(self, name, n=1):
+        with self._shared:
+            self._counters[COUNTERS.index(name)] += n
+
+    def sweep(self):
+        """Remove expired units, then least recently used ones while over the quota"""
+        with self._lock:
+            now = time.time()
+            units = []
+            for unit in self._units():
+                if unit.expires and now - unit.last_used > self.ttls[unit.kind]:
+                    self._evict(unit, "expired")
+                else:
+                    units.append(unit)
+
+            usage = sum(unit.size for unit in units)
+            if usage > self.quota_bytes:
+                # Trim to 90% of the quota so sweeps under pressure stay rare
+                target = self.quota_bytes * 0.9
+                for unit in sorted((u for u in units if u.evictable), key=lambda u: u.last_used):
+                    if usage <= target:
+                        break
+                    self._evict(unit, "evicted")
+                    usage -= unit.size
+            self._usage.value = usage
+            self._count("sweeps")
+
+    def _evict(self, unit, reason):
+        for key in unit.cache_keys:
+            self.result_cache.discard(key)
+        for path in unit.paths:
+            _remove(path)
+        self._count(reason)
+        self._count("freed_bytes", unit.size)
+
+    def _units(self):
+        yield from self._document_units()
+        yield from self._job_units()
+        yield from self._workspace_units()
+
+    def _document_units(self):
+        # document id -> [size, last used, paths, cache keys]
+        documents = {}
+        media_root = self.media_store.root
+        if media_root.is_dir():
+            for folder in media_root.iterdir():
+                size, mtime = _tree_stat(folder)
+                documents[folder.name] = [size, mtime, [folder], []]
+        cache_folder = self.result_cache.folder
+        if cache_folder.is_dir():
+            for entry in cache_folder.glob('*.json'):
+                size, mtime = _tree_stat(entry)
+                document = documents.setdefault(entry.name[:DOCUMENT_ID_LENGTH], [0, 0.0, [], []])
+                document[0] += size
+                document[1] = max(document[1], mtime)
+                document[3].append(entry.stem)
+        for size, last_used, paths, cache_keys in documents.values():
+            yield Unit("document", last_used, size, paths, cache_keys, True, True)
+
+    def _job_units(self):
+        folder = self.job_store.folder
+        if not folder.is_dir():
+            return
+        jobs = {}
+        for entry in folder.iterdir():
+            if entry.name.startswith('.tmp-'):
+                continue
+            jobs.setdefault(entry.name.split('.', 1)[0], []).append(entry)
+        for job_id, paths in jobs.items():
+            size, last_used = 0, 0.0
+            for path in paths:
+                path_size, mtime = _tree_stat(path)
+                size += path_size
+                last_used = max(last_used, mtime)
+            finished = self._job_finished(job_id)
+            yield Unit("job", last_used, size, paths, (), finished, finished)
+
+    def _job_finished(self, job_id):
+        try:
+            job = self.job_store.get(job_id)
+        except (OSError, json.JSONDecodeError):
+            return False
+        # Without a state file the other files are leftovers of an interrupted write
+        return job is None or job.get("status") in ("done", "failed")
+
+    def _workspace_units(self):
+        root = self.workspaces.root
+        if not root.is_dir():
+            return
+        for folder in root.iterdir():
+            size, mtime = _tree_stat(folder)
+            # Live workspaces count towards the quota but only expire
+            yield Unit("workspace", mtime, size, [folder], (), True, False)
+
+    def stats(self):
+        with self._shared:
+            counters = dict(zip(COUNTERS, self._counters))
+        return dict(counters, usage_bytes=self.usage, quota_bytes=self.quota_bytes)
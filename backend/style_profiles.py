@@ -0,0 +1,108 @@
+"""House-style profiles: the formatting standard a document is checked against.
+
+Profiles are declared as plain data and compiled once, at import, into the
+sets and the single combined date regex the rules consult for every run and
+paragraph. Further profiles (one per department, say) can be declared in a
+JSON file named by ``STYLE_PROFILES_FILE``: a list of objects shaped like
+the entries of ``PROFILE_SPECS``. A file entry with an existing name
+replaces the built-in profile.
+"""
+import hashlib
+import json
+import os
+import re
+
+DEFAULT_PROFILE = 'default'
+PROFILE_NAME = re.compile(r'[a-z0-9_-]{1,32}')
+
+PROFILE_SPECS = [
+    {
+        "name": DEFAULT_PROFILE,
+        "description": "Times New Roman 12 or 14pt, A4 portrait, 2.5cm margins, justified body text",
+        "fonts": ["Times New Roman"],
+        # Half-points, as in w:sz
+        "sizes": ["28", "24"],
+        "page": {"w": "12240", "h": "15840", "orient": "portrait"},
+        "page_name": "A4 portrait",
+        # Twips: 1418 is 2.5cm, 567 is 1cm
+        "margins": {"top": "1418", "right": "1418", "bottom": "1418", "left": "1418",
+                    "header": "567", "footer": "567", "gutter": "0"},
+        "margin_name": "2.5cm",
+        "justification": "both",
+        # Paragraphs that need not be justified
+        "justification_exempt_styles": ["heading"],
+        "justification_exempt_all_caps": True,
+        # Matched against the lower-cased paragraph text with all whitespace removed
+        "date_patterns": [
+            r'\d{1,2}/\d{1,2}/\d{2,4}',              # 28/05/2025
+            r'\d{4}-\d{1,2}-\d{1,2}',                # 2025-05-28
+            r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\d{1,2},?\d{4}',  # May28,2025
+            r'\d{1,2}(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\d{4}',    # 28May2025
+            r'\d{6}h-\d{6}h(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\d{4}',    # 270800H-280800HMay2025
+            r'\d{4}h-\d{4}h(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\d{4}',    # 2708H-2808HMay2025
+        ],
+    },
+]
+
+
+class UnknownProfile(ValueError):
+    pass
+
+
+class StyleProfile:
+    """A profile compiled into the lookups the rules use"""
+
+    def __init__(self, spec):
+        name = spec["name"]
+        if not PROFILE_NAME.fullmatch(name):
+            raise ValueError(f"Invalid style profile name: {name!r}")
+        self.name = name
+        self.description = spec.get("description", "")
+
+        fonts = spec["fonts"]
+        sizes = spec["sizes"]
+        # A missing attribute is inherited rather than wrong
+        self.allowed_fonts = frozenset(fonts) | {None, "None"}
+        self.allowed_sizes = frozenset(sizes) | {None}
+        self.font_names = " or ".join(fonts)
+        self.size_names = " or ".join(f"{int(size) / 2:g}pt ({size})" for size in sizes)
+
+        self.page = dict(spec["page"])
+        self.page_name = spec.get("page_name", "the required size")
+        self.margins = dict(spec["margins"])
+        self.margin_name = spec.get("margin_name", "the required size")
+
+        self.justification = spec.get("justification", "both")
+        self.exempt_styles = tuple(style.lower() for style in spec.get("justification_exempt_styles", ()))
+        self.exempt_all_caps = spec.get("justification_exempt_all_caps", True)
+        patterns = spec.get("date_patterns", ())
+        self.date_pattern = re.compile('|'.join(f'(?:{p})' for p in patterns)) if patterns else None
+
+        # Identifies the rules applied, for cache keys
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def is_exempt_style(self, style):
+        return bool(self.exempt_styles) and style.lower().startswith(self.exempt_styles)
+
+    def describe(self):
+        return {"name": self.name, "description": self.description, "digest": self.digest}
+
+
+def load_profiles(path=None):
+    """Compile the built-in profiles and those declared in the JSON file at ``path``"""
+    specs = list(PROFILE_SPECS)
+    if path:
+        with open(path) as f:
+            specs.extend(json.load(f))
+    return {profile.name: profile for profile in map(StyleProfile, specs)}
+
+
+PROFILES = load_profiles(os.environ.get('STYLE_PROFILES_FILE'))
+
+
+def get_profile(name=None):
+    """The compiled profile called ``name`` (the default one if empty)"""
+    try:
+        return PROFILES[name or DEFAULT_PROFILE]
+    except KeyError:
+        raise UnknownProfile(f"Unknown style profile: {name}") from None
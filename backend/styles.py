@@ -0,0 +1,182 @@
+"""Effective run properties from styles.xml, docDefaults and the theme fonts.
+
+A run's font and size come from, in increasing priority: the document
+defaults, the paragraph style chain, the character style chain and the
+run's own ``w:rPr``. styles.xml and the theme are parsed once per document,
+each style chain is merged once, and the effective properties are memoized
+per (paragraph style, character style, direct properties), so resolving a
+run costs one pass over its ``w:rPr`` and a dict lookup. Table styles and
+numbering are not taken into account.
+"""
+from collections import namedtuple
+
+from engine import W, W_VAL
+from xml_backend import Path, parse
+
+A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+NS = {'w': W, 'a': A}
+
+STYLES_PART = 'word/styles.xml'
+THEME_PART = 'word/theme/theme1.xml'
+
+W_TYPE = f'{{{W}}}type'
+W_DEFAULT = f'{{{W}}}default'
+W_STYLE_ID = f'{{{W}}}styleId'
+W_RFONTS = f'{{{W}}}rFonts'
+W_SZ = f'{{{W}}}sz'
+W_SZ_CS = f'{{{W}}}szCs'
+W_RSTYLE = f'{{{W}}}rStyle'
+
+# Searches made in styles.xml and the theme, compiled once (see xml_backend)
+FONT_SCHEMES = {kind: Path(f'.//a:{kind}Font', NS) for kind in ('major', 'minor')}
+TYPEFACES = {tag: Path(f'a:{tag}', NS) for tag in ('latin', 'cs', 'ea')}
+RUN_DEFAULTS = Path('w:docDefaults/w:rPrDefault/w:rPr', NS)
+STYLES = Path('.//w:style', NS)
+BASED_ON = Path('w:basedOn', NS)
+STYLE_RUN_PROPERTIES = Path('w:rPr', NS)
+
+# Font slot -> the attribute that points it at a theme font instead
+FONT_SLOTS = (
+    ('ascii', 'asciiTheme'),
+    ('hAnsi', 'hAnsiTheme'),
+    ('cs', 'cstheme'),
+)
+_FONT_ATTRS = tuple((f'{{{W}}}{slot}', f'{{{W}}}{theme}') for slot, theme in FONT_SLOTS)
+
+
+RunProperties = namedtuple('RunProperties', 'ascii hAnsi cs sz szCs')
+EMPTY = RunProperties(None, None, None, None, None)
+
+
+def read_theme_fonts(root):
+    """Map theme font references (minorHAnsi, majorBidi, ...) to typefaces"""
+    fonts = {}
+    for kind, scheme_path in FONT_SCHEMES.items():
+        scheme = scheme_path.first(root)
+        if scheme is None:
+            continue
+        for tag, names in (('latin', ('Ascii', 'HAnsi')), ('cs', ('Bidi',)), ('ea', ('EastAsia',))):
+            elem = TYPEFACES[tag].first(scheme)
+            typeface = elem.get('typeface') if elem is not None else None
+            for name in names:
+                # An empty typeface means the theme leaves the slot unset
+                fonts[kind + name] = typeface or None
+    return fonts
+
+
+class StyleResolver:
+    """Resolve effective run properties against a document's styles"""
+
+    def __init__(self, styles_root=None, theme_fonts=None):
+        self.theme_fonts = theme_fonts or {}
+        self.defaults = EMPTY
+        # style id -> (type, basedOn, own run properties)
+        self.styles = {}
+        self.default_paragraph_style = None
+        self._chains = {}
+        self._bases = {}
+        self._effective = {}
+        if styles_root is not None:
+            self._read_styles(styles_root)
+
+    @classmethod
+    def from_docx(cls, docx):
+        """Parse styles.xml and the theme of an open DOCX; missing parts mean no inheritance"""
+        names = set(docx.namelist())
+        theme_fonts = None
+        if THEME_PART in names:
+            with docx.open(THEME_PART) as f:
+                theme_fonts = read_theme_fonts(parse(f))
+        styles_root = None
+        if STYLES_PART in names:
+            with docx.open(STYLES_PART) as f:
+                styles_root = parse(f)
+        return cls(styles_root, theme_fonts)
+
+    def _read_styles(self, root):
+        r_pr = RUN_DEFAULTS.first(root)
+        if r_pr is not None:
+            self.defaults = self._merge(EMPTY, self._layer(r_pr))
+
+        for style in STYLES.all(root):
+            style_id = style.get(W_STYLE_ID)
+            if style_id is None:
+                continue
+            style_type = style.get(W_TYPE)
+            based_on = BASED_ON.first(style)
+            r_pr = STYLE_RUN_PROPERTIES.first(style)
+            self.styles[style_id] = (
+                style_type,
+                based_on.get(W_VAL) if based_on is not None else None,
+                self._layer(r_pr) if r_pr is not None else {},
+            )
+            if style_type == 'paragraph' and style.get(W_DEFAULT) in ('1', 'true'):
+                self.default_paragraph_style = style_id
+
+    def _layer(self, r_pr):
+        """The properties one w:rPr sets, with theme fonts already looked up"""
+        layer = {}
+        for child in r_pr:
+            tag = child.tag
+            if tag == W_RFONTS:
+                for (slot, _), (attr, theme_attr) in zip(FONT_SLOTS, _FONT_ATTRS):
+                    # A theme reference wins over an explicit font in the same element
+                    font = self.theme_fonts.get(child.get(theme_attr)) or child.get(attr)
+                    if font is not None:
+                        layer[slot] = font
+            elif tag == W_SZ:
+                layer['sz'] = child.get(W_VAL)
+            elif tag == W_SZ_CS:
+                layer['szCs'] = child.get(W_VAL)
+        return layer
+
+    @staticmethod
+    def _merge(props, layer):
+        return props._replace(**layer) if layer else props
+
+    def _chain(self, style_id, seen=()):
+        """Run properties set by a style and the styles it is based on"""
+        props = self._chains.get(style_id)
+        if props is not None:
+            return props
+        style = self.styles.get(style_id)
+        if style is None or style_id in seen:
+            return EMPTY
+        _, based_on, layer = style
+        props = self._chain(based_on, seen + (style_id,)) if based_on else EMPTY
+        props = self._merge(props, layer)
+        self._chains[style_id] = props
+        return props
+
+    def _base(self, p_style, r_style):
+        key = (p_style, r_style)
+        props = self._bases.get(key)
+        if props is None:
+            props = self.defaults
+            for style_id in (p_style or self.default_paragraph_style, r_style):
+                if style_id:
+                    chain = self._chain(style_id)
+                    props = self._merge(props, {k: v for k, v in chain._asdict().items() if v is not None})
+            self._bases[key] = props
+        return props
+
+    def run_properties(self, p_style, r_pr):
+        """Effective RunProperties of a run in a paragraph of style ``p_style``"""
+        r_style = None
+        direct = ()
+        if r_pr is not None:
+            for child in r_pr:
+                tag = child.tag
+                if tag == W_RSTYLE:
+                    r_style = child.get(W_VAL)
+                elif tag == W_RFONTS or tag == W_SZ or tag == W_SZ_CS:
+                    direct += (tag, tuple(child.attrib.items()))
+
+        key = (p_style, r_style, direct)
+        props = self._effective.get(key)
+        if props is None:
+            props = self._base(p_style, r_style)
+            if direct:
+                props = self._merge(props, self._layer(r_pr))
+            self._effective[key] = props
+        return props
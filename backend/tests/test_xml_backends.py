@@ -0,0 +1,51 @@
+"""The lxml and ElementTree backends must give identical validation results.
+
+The backend is chosen when xml_backend is imported, so each document is
+validated in a child process per backend, with XML_BACKEND set.
+
+    cd backend && python -m pytest -q tests
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from docx_generator import DocumentSpec, generate  # noqa: E402
+
+pytest.importorskip('lxml')
+
+VALIDATE = """
+import json, sys, tempfile
+from Validation import validate_docx_file
+with tempfile.TemporaryDirectory() as media:
+    results = validate_docx_file(sys.argv[1], '0' * 64, media)
+print(json.dumps(results, sort_keys=True))
+"""
+
+SPECS = {
+    'small': DocumentSpec(paragraphs=50, images=5),
+    'figures': DocumentSpec(paragraphs=1000, images=100, figure_references=0.2),
+    'parts': DocumentSpec(paragraphs=500, images=10, headers=2, footnotes=20),
+}
+
+
+def validate_with(backend, path):
+    completed = subprocess.run([sys.executable, '-c', VALIDATE, path], cwd=BACKEND_DIR,
+                               env=dict(os.environ, XML_BACKEND=backend), capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize('name', SPECS)
+def test_backends_agree(tmp_path, name):
+    path = str(tmp_path / f'{name}.docx')
+    generate(SPECS[name], path)
+    etree_results = validate_with('etree', path)
+    lxml_results = validate_with('lxml', path)
+    assert etree_results["content"]
+    assert lxml_results == etree_results
@@ -0,0 +1,171 @@
+"""Validate many .docx files offline and write a JSONL report.
+
+    cd backend && python validate_cli.py submissions/ -o report.jsonl
+    cd backend && python validate_cli.py "submissions/**/*.docx" --full --profile default
+
+Each argument is a file, a directory (searched recursively for .docx) or
+a glob. Files are validated in parallel, one per core by default. Each
+document gets one JSON line, in completion order. A final line holds the
+aggregate ``summary``. By default only the issues are checked, with no
+HTML rendering and no image extraction. ``--full`` adds the same results
+the /validate endpoint returns.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from Validation import (
+    DOCUMENT_PART, InvalidDocument, check_docx_structure, has_part, hash_upload, open_docx,
+    summarize_issues, validate_docx_structure, validate_parts,
+)
+from safe_zip import ArchiveTooLarge
+from style_profiles import UnknownProfile, get_profile
+
+
+def find_documents(targets):
+    """Paths of the .docx files named by ``targets``, each once, in a stable order"""
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            matches = glob.glob(os.path.join(target, '**', '*.docx'), recursive=True)
+        elif os.path.isfile(target):
+            matches = [target]
+        else:
+            matches = glob.glob(target, recursive=True)
+        # Word's lock files (~$name.docx) are not documents
+        paths.extend(p for p in sorted(matches) if not os.path.basename(p).startswith('~$'))
+    return list(dict.fromkeys(paths))
+
+
+def validate_path(path, profile_name=None, full=False):
+    """One report record for the document at ``path``; never raises"""
+    start = time.perf_counter()
+    record = {"file": path}
+    try:
+        with open(path, 'rb') as f:
+            record["document_id"] = hash_upload(f)
+            with open_docx(f) as docx:
+                if not has_part(docx, DOCUMENT_PART):
+                    raise InvalidDocument("Invalid DOCX file structure")
+                profile = get_profile(profile_name)
+                if full:
+                    results = validate_docx_structure(docx, profile=profile)
+                    record["paragraphs"] = len(results.pop("paragraph_hashes")["paragraphs"])
+                    record["errors"] = results.pop("errors")
+                    record["results"] = results
+                else:
+                    ctx, record["paragraphs"] = check_docx_structure(docx, profile)
+                    record["errors"] = summarize_issues(ctx, validate_parts(docx, ctx, render=False))
+        record["status"] = "ok"
+    except (zipfile.BadZipFile, InvalidDocument):
+        record["status"] = "error"
+        record["error"] = "Invalid DOCX file structure"
+    except (ArchiveTooLarge, OSError, ValueError) as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    except Exception as e:
+        # Anything unexpected in one file must not stop the run
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def validate_all(paths, workers, profile_name=None, full=False):
+    """Yield a record per path, in completion order, validating ``workers`` files at a time
+
+    Files are handed out as workers free up, so a worker crash only fails
+    the files the pool had in hand; the pool is then replaced for the rest.
+    """
+    queue = deque(paths)
+    pending = {}
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while queue or pending:
+            while queue and len(pending) < workers:
+                path = queue.popleft()
+                try:
+                    future = pool.submit(validate_path, path, profile_name, full)
+                except BrokenProcessPool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    future = pool.submit(validate_path, path, profile_name, full)
+                pending[future] = (path, pool)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, used = pending.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    if used is pool:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = ProcessPoolExecutor(max_workers=workers)
+                    yield {"file": path, "status": "error", "error": "Validation worker crashed"}
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def summarize(records, seconds):
+    """Aggregate counts over every record of a run"""
+    ok = [record for record in records if record["status"] == "ok"]
+    documents_with = Counter()
+    for record in ok:
+        for issue_type in {issue["type"] for issue in record["errors"]["summary"]}:
+            documents_with[issue_type] += 1
+    return {
+        "total": len(records),
+        "ok": len(ok),
+        "failed": len(records) - len(ok),
+        # Documents with at least one issue of each type (error, warning, info)
+        "documents_with": dict(documents_with),
+        "paragraphs": sum(record["paragraphs"] for record in ok),
+        "seconds": round(seconds, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('targets', nargs='+', help=".docx files, directories or globs")
+    parser.add_argument('-o', '--output', help="JSONL file to write (default: standard output)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--profile', help="style profile to check against (default: the house style)")
+    parser.add_argument('--full', action='store_true', help="include rendered content, word errors and images")
+    args = parser.parse_args(argv)
+
+    try:
+        get_profile(args.profile)
+    except UnknownProfile as e:
+        parser.error(str(e))
+    paths = find_documents(args.targets)
+    if not paths:
+        parser.error("no .docx files found")
+
+    start = time.perf_counter()
+    records = []
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        workers = max(1, min(args.workers, len(paths)))
+        for done, record in enumerate(validate_all(paths, workers, args.profile, args.full), 1):
+            out.write(json.dumps(record) + "\n")
+            # Only what the summary needs is kept; full results can be large
+            record.pop("results", None)
+            records.append(record)
+            print(f"\r{done}/{len(paths)} validated", end='', file=sys.stderr, flush=True)
+        summary = summarize(records, time.perf_counter() - start)
+        out.write(json.dumps({"summary": summary}) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"\n{summary['ok']} validated, {summary['failed']} failed in {summary['seconds']}s", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
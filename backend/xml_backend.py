@@ -0,0 +1,164 @@
+"""XML parsing for the validators, on lxml when it is installed and ElementTree otherwise.
+
+Trees are built with ``iterparse``, ``parse`` and ``fromstring`` from
+here, and searched with ``Path`` and ``Text`` queries compiled once at
+import. On lxml a query is a precompiled XPath evaluated in C, and
+parsers accept huge trees (deep nesting, text nodes over 10 MB). On
+ElementTree it is the equivalent ElementPath expression, with
+descendant searches for one tag done by ``iter()`` (which also matches
+the element itself; no query searches for its element's own tag).
+
+Both backends give the validators the same trees: comments and
+processing instructions are dropped, entities are not resolved and
+nothing is fetched from the network. benchmarks/bench_xml_backends.py
+checks that they agree and compares their speed.
+
+``XML_BACKEND`` (``etree`` or ``lxml``) picks the backend. ElementTree is
+the default even when lxml is installed: lxml parses faster, but the
+rules touch every run and text element from Python, and lxml builds a
+proxy object for each one, so whole validations measured 20-25% slower
+on it. lxml is there for rules that move more of their work into XPath.
+"""
+import os
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+XML_BACKEND = os.environ.get('XML_BACKEND', 'etree')
+if XML_BACKEND not in ('lxml', 'etree'):
+    raise ValueError(f"XML_BACKEND must be 'lxml' or 'etree', not {XML_BACKEND!r}")
+if XML_BACKEND == 'lxml' and etree is None:
+    raise ImportError("XML_BACKEND is 'lxml' but lxml is not installed")
+
+PARSER_OPTIONS = dict(huge_tree=True, resolve_entities=False, no_network=True,
+                      remove_comments=True, remove_pis=True)
+
+
+def _clark(name, namespaces):
+    prefix, _, local = name.rpartition(':')
+    return f'{{{namespaces[prefix]}}}{local}' if prefix else local
+
+
+def _steps(path, namespaces):
+    """('descendant', tag) for './/p:tag', ('child', [tags]) for 'p:a/p:b', else None"""
+    if path.startswith('.//'):
+        descendant, path = True, path[3:]
+    else:
+        descendant = False
+    names = path.split('/')
+    if any(not name or any(c in name for c in '.*[@{') for name in names) or (descendant and len(names) > 1):
+        return None
+    tags = [_clark(name, namespaces or {}) for name in names]
+    return ('descendant', tags[0]) if descendant else ('child', tags)
+
+
+if XML_BACKEND == 'lxml':
+    _parser = etree.XMLParser(**PARSER_OPTIONS)
+
+    def iterparse(source, events=('end',)):
+        """(event, element) pairs while ``source`` (a path or binary file object) is parsed"""
+        return etree.iterparse(source, events=events, **PARSER_OPTIONS)
+
+    def parse(source):
+        """The root element of ``source``"""
+        return etree.parse(source, _parser).getroot()
+
+    def fromstring(data):
+        return etree.fromstring(data, _parser)
+
+    def detach(parent, elem):
+        """Remove a finished element from its parent during iterparse
+
+        lxml may have parsed past ``elem`` already, so it is removed by identity.
+        """
+        parent.remove(elem)
+
+    class Path:
+        """Elements matching ``path`` below an element: ``first(elem)`` or ``all(elem)``"""
+
+        def __init__(self, path, namespaces=None):
+            self.path = path
+            self.all = etree.XPath(path, namespaces=namespaces)
+
+        def first(self, elem):
+            found = self.all(elem)
+            return found[0] if found else None
+
+    class Text:
+        """The text of the elements matching ``path`` below an element, joined"""
+
+        def __init__(self, path, namespaces=None):
+            self.path = path
+            self._texts = etree.XPath(f'{path}/text()', namespaces=namespaces)
+
+        def __call__(self, elem):
+            return ''.join(self._texts(elem))
+
+else:
+    def iterparse(source, events=('end',)):
+        """(event, element) pairs while ``source`` (a path or binary file object) is parsed"""
+        return ET.iterparse(source, events=events)
+
+    def parse(source):
+        """The root element of ``source``"""
+        return ET.parse(source).getroot()
+
+    def fromstring(data):
+        return ET.fromstring(data)
+
+    def detach(parent, elem):
+        """Remove a finished element from its parent during iterparse
+
+        Events arrive in batches, so later siblings may already be attached
+        and it is removed by identity.
+        """
+        parent.remove(elem)
+
+    class Path:
+        """Elements matching ``path`` below an element: ``first(elem)`` or ``all(elem)``
+
+        Single-tag searches are done in C, by ``iter()`` for descendants and
+        by ``find()`` with the tag in Clark notation for children.
+        """
+
+        def __init__(self, path, namespaces=None):
+            self.path = path
+            steps = _steps(path, namespaces)
+            if steps is None:
+                self.first = lambda elem: elem.find(path, namespaces)
+                self.all = lambda elem: elem.findall(path, namespaces)
+            elif steps[0] == 'descendant':
+                tag = steps[1]
+                self.first = lambda elem: next(elem.iter(tag), None)
+                self.all = lambda elem: list(elem.iter(tag))
+            else:
+                *parents, tag = steps[1]
+
+                def candidates(elem):
+                    level = [elem]
+                    for parent in parents:
+                        level = [child for e in level for child in e.findall(parent)]
+                    return level
+
+                def first(elem):
+                    for e in candidates(elem):
+                        found = e.find(tag)
+                        if found is not None:
+                            return found
+                    return None
+
+                self.first = first
+                self.all = lambda elem: [found for e in candidates(elem) for found in e.findall(tag)]
+
+    class Text:
+        """The text of the elements matching ``path`` below an element, joined"""
+
+        def __init__(self, path, namespaces=None):
+            self.path = path
+            self._all = Path(path, namespaces).all
+
+        def __call__(self, elem):
+            return ''.join(e.text or '' for e in self._all(elem))